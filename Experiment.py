@@ -1,13 +1,67 @@
 """Some sample experiments and operations that you might want to use to test an ESN."""
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+import os
+import pickle
 import numpy
 import TinyESN
+import metrics
 from benchmark import BenchMark
+from instrumentation import Instrumentation
+
+
+def _picklable(*objects):
+    """Whether objects can be sent to worker processes (functions such as lambdas can not)."""
+    try:
+        pickle.dumps(objects)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+
+def _pyplot():
+    """Import matplotlib.pyplot on first use, so that running experiments without plotting them does not load it."""
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _run_once(params, benchmark: BenchMark, seed, probe=None):
+    """
+    Build, train and test one ESN, and return its training and testing NRMSEs. Runs in the worker processes of Experiment.run_many.
+
+    probe (default None): Instrumentation the ESN and the run are timed with. Its counters are also returned, so that workers can send them back.
+    """
+    esn_seed, benchmark_seed = seed.spawn(2)
+    esn = TinyESN.TinyESN(*params, seed=esn_seed, instrumentation=probe)
+    phase = esn._phase
+    with phase("benchmark"):
+        benchmark.seed(benchmark_seed)
+        benchmark.reset()
+        data = benchmark.create_training_set(500)
+        testing_set, training_set = data.split(len(data)//2)
+    with phase("train"):
+        esn.train_pseudoinverse(training_set, record_outputs=True)
+    training_nrmse = Experiment.nrmse(training_set.targets[10:], esn.outputs)
+    with phase("test"):
+        esn.test(testing_set)
+    testing_nrmse = Experiment.nrmse(testing_set.targets, esn.outputs)
+    return training_nrmse, testing_nrmse, None if probe is None else probe.as_dict()
+
 
 class Experiment():
     """Define sample experiments that might be of use when testing an ESN.""" 
-    def __init__(self):
-        """Initialise the Experiment class."""
+    def __init__(self, processes=None, seed=None, instrumentation=None):
+        """
+        Initialise the Experiment class.
+
+        processes (default None): number of worker processes used by run_many. None uses every core, 1 runs everything in this process.
+        Runs whose params or benchmark can not be pickled (such as an ESN with a lambda as update function) are always made in this process.
+        seed (default None): master seed from which the seed of every run is derived, so that runs can be reproduced.
+        instrumentation (default None): Instrumentation timing the ESNs built by run_many (see instrumentation.py).
+        Worker processes time their runs with their own counters, which are added to it when they are done. Hooks are only called for runs made in this process.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.seed = seed
+        self.instrumentation = instrumentation
         self.default_params = {"K": 1,
                                 "N": 30,
                                 "L": 1,
@@ -18,19 +72,10 @@ class Experiment():
                                 "connectivity": 0.1,
                                 "input_norm": True}
     
-    def nrmse(self, target_output_set, real_output_set):#any idea why this appears to converge to 1?
-        """Perform the normalised root mean squared error over the target and output sets."""
-        if len(target_output_set) != len(real_output_set):
-            raise ValueError(f"Found input variables with inconstitent numbers of samples [{len(target_output_set)}, {len(real_output_set)}]")
-        output_average = sum(target_output_set)/len(target_output_set)
-        top = 0
-        bottom = 0
-        for i in range(1, len(target_output_set)):
-            top += (target_output_set[i] - real_output_set[i])**2
-            bottom += (target_output_set[i] - output_average)**2
-        top = top/len(target_output_set)
-        bottom = bottom/len(target_output_set)
-        return float(numpy.sqrt(top/bottom))
+    @staticmethod
+    def nrmse(target_output_set, real_output_set):
+        """Perform the normalised root mean squared error over the target and output sets (see metrics.nrmse)."""
+        return metrics.nrmse(target_output_set, real_output_set)
 
     def show_esn_nrmse(self, params, benchmark: BenchMark):
         """
@@ -38,6 +83,7 @@ class Experiment():
 
         params: tuple of the parametres for the ESN to train. (Default param examples can be found in self.default_params).
         """
+        plt = _pyplot()
         benchmark.reset()
         training, testing = self.run_many(params, 100, benchmark)
         data = [training, testing]
@@ -53,6 +99,7 @@ class Experiment():
 
         name_1, name2: name given to the ESNs (to use when labelling boxplots)
         """
+        plt = _pyplot()
         benchmark1.reset()
         benchmark2.reset()
         esn_1_training, esn_1_testing = self.run_many(params_1, 100, benchmark1)
@@ -70,20 +117,20 @@ class Experiment():
 
         benchmark: instantiation of a benchmark against which to train the NMSRE, such as NARMA10. 
         """
+        plt = _pyplot()
         _, axs = plt.subplots(2)
         benchmark.reset()
         data = benchmark.create_training_set(1000)
         esn = TinyESN.TinyESN(*params)
-        training_set = dict(list(data.items())[(len(data)//2):])
-        testing_set = dict(list(data.items())[:(len(data)//2)])
-        esn.train_pseudoinverse(training_set)
+        testing_set, training_set = data.split(len(data)//2)
+        esn.train_pseudoinverse(training_set, record_outputs=True)
         axs[0].set_title("training")
-        axs[0].plot(list(training_set.values())[10:])
+        axs[0].plot(training_set.targets[10:])
         # print(esn.outputs)
         axs[0].plot(esn.outputs)
         esn.test(testing_set)
         axs[1].set_title("testing")
-        axs[1].plot(list(testing_set.values()))
+        axs[1].plot(testing_set.targets)
         axs[1].plot(esn.outputs)
         return
 
@@ -95,6 +142,7 @@ class Experiment():
 
         name_1, name2: name given to the ESNs
         """
+        plt = _pyplot()
         _, axs = plt.subplots(2)
         benchmark1.reset()
         benchmark2.reset()
@@ -102,27 +150,25 @@ class Experiment():
         data2 = benchmark2.create_training_set(1000)
         esn_1 = TinyESN.TinyESN(*params_1)
         esn_2 = TinyESN.TinyESN(*params_2)
-        training_set1 = dict(list(data1.items())[(len(data1)//2):])
-        testing_set1 = dict(list(data1.items())[:(len(data1)//2)])
-        training_set2 = dict(list(data2.items())[(len(data1)//2):])
-        testing_set2 = dict(list(data2.items())[:(len(data1)//2)])
-        esn_1.train_pseudoinverse(training_set1)
-        esn_2.train_pseudoinverse(training_set2)
+        testing_set1, training_set1 = data1.split(len(data1)//2)
+        testing_set2, training_set2 = data2.split(len(data1)//2)
+        esn_1.train_pseudoinverse(training_set1, record_outputs=True)
+        esn_2.train_pseudoinverse(training_set2, record_outputs=True)
         axs[0].set_title("training")
-        axs[0].plot(list(training_set1.values())[10:], label="target values 1")
-        axs[0].plot(list(training_set2.values())[10:], label="target values 2")
+        axs[0].plot(training_set1.targets[10:], label="target values 1")
+        axs[0].plot(training_set2.targets[10:], label="target values 2")
         axs[0].plot(esn_1.outputs, label=name_1)
         axs[0].plot(esn_2.outputs, label=name_2)
         esn_1.test(testing_set1)
         esn_2.test(testing_set2)
         axs[1].set_title("testing")
-        axs[1].plot(list(testing_set1.values()), label="target values 1")
-        axs[1].plot(list(testing_set2.values()), label="target values 2")
+        axs[1].plot(testing_set1.targets, label="target values 1")
+        axs[1].plot(testing_set2.targets, label="target values 2")
         axs[1].plot(esn_1.outputs, label=name_1)
         axs[1].plot(esn_2.outputs, label=name_2)
         return
 
-    def run_many(self, params, amount: int, benchmark: BenchMark):
+    def run_many(self, params, amount: int, benchmark: BenchMark, processes=None, seed=None):
         """
         Run an ESN with the given params a certain number of times, and return the resulting NRMSEs.
 
@@ -130,21 +176,24 @@ class Experiment():
 
         amount: number of times the ESN will be run.
 
-        returns the nrmses for the training and the testing sets.
+        processes (default self.processes): number of worker processes the runs are spread over. The runs are made in this process if params or benchmark can not be pickled.
+
+        seed (default self.seed): master seed. Every run gets its own generator seeded from it, so the results do not depend on the number of processes.
+
+        returns the nrmses for the training and the testing sets, in run order.
         """
-        training_nrmses = []
-        testing_nrmses = []
-        for _ in range(amount):
-            esn = TinyESN.TinyESN(*params)
-            benchmark.reset()
-            data = benchmark.create_training_set(500)
-            training_set = dict(list(data.items())[(len(data)//2):])
-            testing_set = dict(list(data.items())[:(len(data)//2)])
-            esn.train_pseudoinverse(training_set)
-            training_nrmse = self.nrmse(list(training_set.values())[10:], esn.outputs[:])
-            esn.test(testing_set)
-            testing_nrmse = self.nrmse(list(testing_set.values()), esn.outputs)
-            training_nrmses.append(training_nrmse)
-            testing_nrmses.append(testing_nrmse)
-            del esn
+        processes = processes or self.processes
+        seeds = numpy.random.SeedSequence(self.seed if seed is None else seed).spawn(amount)
+        jobs = ([params]*amount, [benchmark]*amount, seeds)
+        if processes == 1 or amount == 1 or not _picklable(params, benchmark):
+            results = list(map(_run_once, *jobs, [self.instrumentation]*amount))
+        else:
+            probes = [None if self.instrumentation is None else Instrumentation() for _ in range(amount)]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_run_once, *jobs, probes, chunksize=max(1, amount//(4*processes))))
+            if self.instrumentation is not None:
+                for result in results:
+                    self.instrumentation.merge(result[2])
+        training_nrmses = [result[0] for result in results]
+        testing_nrmses = [result[1] for result in results]
         return training_nrmses, testing_nrmses
@@ -1,17 +1,22 @@
 """Abstract module for the various NARMA benchmarks."""
 from abc import abstractmethod
+import math
 import numpy
 from benchmark import BenchMark
+from dataset import Dataset
 
 class NARMA(BenchMark):
     """Abstract class for the NARMA benchmarks."""
 
     @abstractmethod
-    def __init__(self, mode="discretised"):
-        """Initialise the various NARMA benchmarks. Set the various parametres to zero."""
+    def __init__(self, mode="discretised", bounded=False):
+        """
+        Initialise the various NARMA benchmarks. Set the various parametres to zero.
+
+        bounded (default False): whether every output goes through tanh, which keeps the series from diverging (as NARMA20 does after a few thousand steps without it).
+        """
         self.y = 0
         self.timestep = 0
-        self.history = {}
         self.input = 0
         self.alpha = 0
         self.beta = 0
@@ -22,81 +27,87 @@ class NARMA(BenchMark):
         if mode not in possible_modes:
             raise ValueError("mode type is invalid.")
         self.mode = mode
+        self.bounded = bounded
+        self._inputs = None
+        self._outputs = None
+        self._output_sum = 0
     
     def increment_timestep(self, current_input):
         """Increment the timestep based on the mode chosen."""
-        if self.mode == "discretised":
-            self._increment_timestep_discretised(current_input)
-        else:
-            self._increment_timestep_inst(current_input)
-        return 
-
-    def _increment_timestep_discretised(self, current_input):
-        """Get the output for the current input in a discretised manner."""
-        history_sum = 0
-        r = 0
-        
-        if len(self.history) == 0:
-            r = 0
-            input_N = 0
-            history_sum = 0
-        elif len(self.history) < self.N-1:
-            r = len(self.history)
-            input_N = list(self.history.keys())[self.timestep - r]
-            for i in range(r):
-                history_sum += list(self.history.values())[(self.timestep-1)-i]
-        else:
-            r = self.N-1
-            input_N = list(self.history.keys())[self.timestep - r]
-            for i in range(r-1):
-                history_sum += list(self.history.values())[(self.timestep-1)-i]
-
-        self.y = self.alpha*self.y + (self.beta*self.y)*history_sum + self.gamma*input_N*self.input + self.delta
-        self.input = (current_input)
-        self.history[self.input] = numpy.array([float(self.y)])
-        self.timestep += 1
+        self._generate(numpy.array([current_input], dtype=float), numpy.empty(1))
         return 
 
-    def _increment_timestep_inst(self, current_input):
-        """Get the output for the current input in an instantaneous manner."""
-        history_sum = 0
-        r = 0
-        self.input = (current_input)
-        if len(self.history) == 0:
-            r = 0
-            input_N = 0
-            history_sum = 0
-        elif len(self.history) < self.N - 1:
-            r = len(self.history)
-            input_N = list(self.history.keys())[self.timestep - r]
-            for i in range(r):
-                history_sum += list(self.history.values())[(self.timestep-1)-i]
-        else:
-            r = self.N - 1
-            input_N = list(self.history.keys())[self.timestep - r]
-            for i in range(r-1):
-                history_sum += list(self.history.values())[(self.timestep-1)-i]
-
-        self.y = self.alpha*self.y + (self.beta*self.y)*history_sum + self.gamma*input_N*self.input + self.delta
+    def _generate(self, inputs, outputs):
+        """
+        Get the outputs for a sequence of inputs, writing them into the preallocated outputs array.
 
-        self.history[self.input] = numpy.array([float(self.y)])
-        self.timestep += 1
+        Only the last N-1 inputs and the running sum of the last N-2 outputs are kept, in circular buffers, so every timestep is O(1).
+        In discretised mode the output is driven by the previous input, in instantaneous mode by the current one.
+        Raises a ValueError if the series diverges.
+        """
+        if self.timestep == 0:
+            self._inputs = [0.0]*max(self.N - 1, 1)
+            self._outputs = [0.0]*max(self.N - 2, 1)
+            self._output_sum = 0.0
+        # the NARMA recurrence is nonlinear in y, so the timesteps cannot be vectorised; locals keep the loop tight
+        alpha, beta, gamma, delta = self.alpha, self.beta, self.gamma, self.delta
+        instantaneous = self.mode == "instantaneous"
+        bounded = self.bounded
+        input_history, output_history = self._inputs, self._outputs
+        input_size, output_size = len(input_history), len(output_history)
+        y, previous, timestep, history_sum = float(self.y), float(self.input), self.timestep, self._output_sum
+        for i, current in enumerate(inputs.tolist()):
+            if instantaneous:
+                previous = current
+            if timestep == 0:
+                input_N = 0
+            elif timestep < self.N - 1:
+                input_N = input_history[0]
+            else:
+                #the oldest of the last N-1 inputs
+                input_N = input_history[timestep % input_size]
+            y = alpha*y + (beta*y)*history_sum + gamma*input_N*previous + delta
+            if bounded:
+                y = math.tanh(y)
+            input_history[timestep % input_size] = current
+            if timestep >= output_size:
+                history_sum -= output_history[timestep % output_size]
+            output_history[timestep % output_size] = y
+            history_sum += y
+            previous = current
+            outputs[i] = y
+            timestep += 1
+        self.y, self.input, self.timestep, self._output_sum = y, previous, timestep, history_sum
+        # once the series overflows it stays inf or nan, so checking the last output is enough
+        if not math.isfinite(y):
+            first = self.timestep - len(outputs) + int(numpy.argmin(numpy.isfinite(outputs)))
+            raise ValueError(f"the NARMA{self.N} series diverged at timestep {first}, please set bounded=True to keep it finite")
+        return outputs
 
     def _generate_input(self):
         """Generate a random input."""
-        return numpy.random.random_sample()/2
+        return self.rng.random()/2
     
+    def generate(self, size):
+        """
+        Generate size timesteps at once.
+
+        returns the (size,) inputs and outputs arrays.
+        """
+        inputs = self.rng.random(size)/2
+        outputs = self._generate(inputs, numpy.empty(size))
+        return inputs, outputs
+
     def create_training_set(self, size):
         """
-        Create a set of NARMA10 inputs and outputs.
+        Create a set of NARMA inputs and outputs.
         
         size: size of the output set.
         """
-        for _ in range(size):
-            self.increment_timestep(self._generate_input())
-        return self.history
+        return Dataset(*self.generate(size))
 
     def reset(self):
-        self.history = {}
         self.timestep = 0
+        self.y = 0
+        self.input = 0
         return
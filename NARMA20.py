@@ -2,16 +2,17 @@
 import numpy
 from NARMA import NARMA
 
-class Narma5(NARMA):
-    """Create a NARMA5 dataset."""
+class Narma20(NARMA):
+    """Create a NARMA20 dataset."""
 
-    def __init__(self, mode="discretised"):
+    def __init__(self, mode="discretised", bounded=False):
         """
         Initialise the dataset and set the mode.
         
         mode (default: "discretised"): whether the output will be acquired in an instantaneous or dicretised fashion.
+        bounded (default: False): whether the outputs go through tanh, as in the usual definition of NARMA20. Without it the series diverges after a few thousand steps.
         """
-        super().__init__(mode)
+        super().__init__(mode, bounded)
         self.alpha = 0.3
         self.beta = 0.05
         self.gamma = 1.5
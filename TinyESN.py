@@ -1,6 +1,53 @@
 import numpy as numpy
-import decimal
-import igraph
+import json
+import struct
+import types
+import zipfile
+import spectral
+import engines
+import readout
+from stencil import MOORE, RING, Stencil
+from dataset import Dataset
+from instrumentation import _NO_PHASE
+
+
+def _memmap_npz(path, names):
+    """
+    Memory-map arrays of an uncompressed .npz file, read-only.
+
+    path: path of the .npz file.
+    names: names of the arrays to map.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for name in names:
+            info = archive.getinfo(name + ".npy")
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("can only memory-map uncompressed .npz files")
+            # the data of a zip member starts after its 30 byte local header, its file name and its extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = numpy.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+            if numpy.prod(shape) == 0:
+                arrays[name] = numpy.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = numpy.memmap(path, dtype=dtype, mode="r", shape=shape, order="F" if fortran_order else "C", offset=f.tell())
+    return arrays
+
+
+def _scipy_sparse():
+    """Import scipy.sparse on first use, as it is only needed for sparse reservoirs. Returns None if scipy is not installed."""
+    try:
+        import scipy.sparse
+    except ImportError:
+        return None
+    return scipy.sparse
+
 
 class TinyESN():
     """
@@ -10,7 +57,10 @@ class TinyESN():
     Initialising, training, and testing the ESN are all supported.
     currently training is only done using the pseudoinverse method.
     """
-    def __init__(self, K: int, N: int, L: int, f=numpy.tanh, mode="discretised", feedback=False, topology="random", connectivity=0.1, input_norm=True):
+    _training_block = 4096 #number of timesteps harvested at a time when training
+    _dense_spectral_limit = 256 #largest reservoir for which "auto" computes every eigenvalue of W
+
+    def __init__(self, K: int, N: int, L: int, f=numpy.tanh, mode="discretised", feedback=False, topology="random", connectivity=0.1, input_norm=True, storage="auto", sparse_threshold=0.05, spectral_method="auto", seed=None, grid_shape=None, dtype=numpy.float64, instrumentation=None, state_cache=None, engine="numpy"):
         """
         Initialise the ESN.
 
@@ -22,6 +72,17 @@ class TinyESN():
         feedback (default False): whether feedback is accounted for when updating.
         topology (default random): topology of the reservoir layer. values: "random", "ring", "lattice", "torus", "fully_connected".
         connectivity (default 0.1): connectivity of the weight matrix (only relevant for the random topology).
+        storage (default "auto"): how the weight matrix is stored. values: "auto", "dense", "sparse", "stencil". "sparse" uses a scipy CSR matrix, "auto" picks it when the density of W falls below sparse_threshold and scipy is installed.
+        "stencil" stores the ring, lattice and torus topologies as weighted shifts of the state (see stencil.py), in O(N) memory. A ring can only be stored as a stencil with a connectivity of 0.
+        sparse_threshold (default 0.05): density of W under which "auto" storage uses a sparse matrix.
+        spectral_method (default "auto"): how eigenvalues and singular values of W are found. values: "auto", "dense", "iterative". "iterative" only looks for the leading one, "auto" uses it for sparse or large reservoirs.
+        seed (default None): seed of the random generator used to build the ESN. Anything numpy.random.default_rng accepts (such as an int or a SeedSequence) works.
+        grid_shape (default None): (rows, columns) of the grid for the lattice and torus topologies. rows*columns must equal N. By default the grid is a square.
+        dtype (default numpy.float64): floating point type of the weights and states used in the simulation. numpy.float32 halves the memory traffic of large reservoirs; the readout is still trained in float64.
+        instrumentation (default None): Instrumentation collecting the timings and calling the hooks of this ESN (see instrumentation.py). It can also be attached later by setting self.instrumentation.
+        engine (default "numpy"): engine running the timestep loop of run (see engines.py). values: "numpy", "numba", "auto". "numba" compiles the loop, which mostly helps small reservoirs, and falls back to "numpy" when numba is not installed or the ESN is not supported. "auto" picks "numba" when it is installed.
+        state_cache (default None): StateCache run reads the states of already seen input sequences from (see state_cache.py). It can also be attached later by setting self.state_cache.
+        A sequence is only read back when it is run from the same state again, such as after reset_state or set_state.
         """
         #Matrix shapes are taken from [1]
         self.input_norm = input_norm
@@ -36,25 +97,72 @@ class TinyESN():
         if connectivity > 1 or connectivity < 0:
             raise ValueError("please set a connectivity between 0 and 1.")
         self.connectivity = connectivity #this only comes into play if the topology is set to random
+        if grid_shape is None and topology in ["lattice", "torus"]:
+            side = int(round(numpy.sqrt(N)))
+            if side*side != N:
+                raise ValueError(f"Can only form a {topology} if nodes can form a square.")
+            grid_shape = (side, side)
+        if grid_shape is not None and grid_shape[0]*grid_shape[1] != N:
+            raise ValueError("please set a grid_shape with as many nodes as N")
+        self.grid_shape = None if grid_shape is None else tuple(grid_shape)
+        storages = ["auto", "dense", "sparse", "stencil"]
+        if storage not in storages:
+            raise ValueError("please set storage to auto, dense, sparse or stencil")
+        if storage == "stencil" and topology not in ["ring", "lattice", "torus"]:
+            raise ValueError("please only use stencil storage with the ring, lattice or torus topology")
+        if storage == "stencil" and topology == "ring" and connectivity > 0:
+            raise ValueError("please set connectivity to 0 to store a ring as a stencil, as its additional random connections are not a stencil")
+        if storage == "sparse" and _scipy_sparse() is None:
+            raise ImportError("scipy is needed for sparse reservoirs")
+        self.storage = storage
+        self.sparse_threshold = sparse_threshold
+        self.sparse = False
+        spectral_methods = ["auto", "dense", "iterative"]
+        if spectral_method not in spectral_methods:
+            raise ValueError("please set spectral_method to auto, dense or iterative")
+        self.spectral_method = spectral_method
+        self._spectral = {}
         self.feedback = feedback
-        self.u = numpy.random.rand(K, 1)
-        self.x = numpy.zeros((N, 1), dtype=numpy.float32)
-        self.v = numpy.zeros((L, 1), dtype=numpy.float32)
-        self.Wu = numpy.random.uniform(low=-1.0, high=1.0, size=N*K)
-        self.Wu = self.Wu.reshape((N, K)) 
-        self.W = numpy.zeros((N, N), dtype=numpy.float32)
-        self.Wv = numpy.random.rand(L, N)
-        self.Wback = numpy.random.rand(N, L)
-        self.func = numpy.vectorize(f)
+        engines.get(engine)
+        self.engine = engine
+        if not numpy.issubdtype(dtype, numpy.floating):
+            raise ValueError("please set a floating point dtype")
+        self.dtype = numpy.dtype(dtype)
+        self.rng = numpy.random.default_rng(seed)
+        self.u = self.rng.random((K, 1)).astype(self.dtype)
+        self.x = numpy.zeros((N, 1), dtype=self.dtype)
+        self.v = numpy.zeros((L, 1), dtype=self.dtype)
+        self.Wu = self.rng.uniform(low=-1.0, high=1.0, size=N*K)
+        self.Wu = self.Wu.reshape((N, K)).astype(self.dtype)
+        self.W = None
+        self.Wv = self.rng.random((L, N)).astype(self.dtype)
+        self.Wback = self.rng.random((N, L)).astype(self.dtype)
+        self.f = f
+        self.func = f if isinstance(f, numpy.ufunc) else numpy.vectorize(f)
+        self.instrumentation = instrumentation
+        self.state_cache = state_cache
+        self._init_runtime()
+        with self._phase("topology"):
+            self._set_topology()
+        with self._phase("scaling"):
+            self._scale_weights()
+        self.initial_state = self.get_state()
+        return
+
+
+    def _init_runtime(self):
+        """Set the attributes that only exist while the ESN is being run or trained."""
         self.t = 0
-        self.M_train = None
-        self.D_train = None
+        self.R = None
+        self.QtD = None
         self.outputs = None
         self.timestep = None
-        self._set_topology()
-        self._scale_weights()
+        self._serving = None
         return
 
+    def _phase(self, name):
+        """Time the phase name if the ESN is instrumented."""
+        return _NO_PHASE if self.instrumentation is None else self.instrumentation.phase(name)
 
     def _scale_weights(self):
         """
@@ -62,13 +170,29 @@ class TinyESN():
         
         This assures the Echo State Property, as detailed in [5]
         """
-        absolute = numpy.vectorize(lambda a: abs(a))
-        eigen_vals = numpy.linalg.eigvals(absolute(self.W))
-        spectral_radius = max(absolute(eigen_vals))
-        if spectral_radius not in eigen_vals:
-            spectral_radius = -spectral_radius
-        self.W = self.W * (1/spectral_radius)
+        # by Perron-Frobenius, the spectral radius of the absolute weights is itself a positive real eigenvalue
+        spectral_radius = spectral.spectral_radius(abs(self.W), method=self._spectral_method(), nonnegative=True)
+        if spectral_radius > 0:
+            self.W = self.W * (1/spectral_radius)
+        # W is built and scaled in float64, and only then cast to the simulation dtype
+        self.W = self.W.astype(self.dtype, copy=False)
+        self._spectral = {}
         return
+
+    def _spectral_method(self):
+        """Get the method used to find eigenvalues and singular values of W."""
+        if self.spectral_method != "auto":
+            return self.spectral_method
+        return "iterative" if self.sparse or self.storage == "stencil" or self.x.size > self._dense_spectral_limit else "dense"
+
+    def _spectral_value(self, name):
+        """Get the spectral radius ("radius") or largest singular value ("singular") of W, computing it only once."""
+        if name not in self._spectral:
+            if name == "radius":
+                self._spectral[name] = spectral.spectral_radius(self.W, method=self._spectral_method())
+            else:
+                self._spectral[name] = spectral.largest_singular_value(self.W, method=self._spectral_method())
+        return self._spectral[name]
     
     def _set_topology(self):
         """Initialise the topology accoding to what is set in init."""
@@ -89,10 +213,39 @@ class TinyESN():
         #sets topology according randomly 
         size = self.x.size
         no_of_weights = int(self.connectivity * (size**2))
-        weights = numpy.random.uniform(low=-1.0, high=1.0, size=no_of_weights)
-        placeholder = numpy.append(numpy.zeros(size**2 - no_of_weights), weights)
-        placeholder = numpy.random.permutation(placeholder).reshape((size, size))
-        self.W = placeholder
+        positions = self._sample_positions(no_of_weights)
+        weights = self.rng.uniform(low=-1.0, high=1.0, size=no_of_weights)
+        self._assemble(positions // size, positions % size, weights)
+        return
+
+    def _sample_positions(self, count):
+        """Pick count distinct positions in W at random, as flat indices."""
+        # this avoids permuting all N^2 entries of W, which does not fit in memory for large reservoirs
+        total = self.x.size**2
+        positions = numpy.unique(self.rng.integers(0, total, size=count))
+        while positions.size < count:
+            positions = numpy.unique(numpy.append(positions, self.rng.integers(0, total, size=count - positions.size)))
+        return positions
+
+    def _assemble(self, rows, cols, values):
+        """
+        Set W from the coordinates of its non-zero weights.
+
+        Repeated coordinates only count once, and negative coordinates count from the end as they would when indexing an array. W is stored as a CSR matrix or a dense array depending on the storage set in init.
+        """
+        size = self.x.size
+        rows = numpy.asarray(rows, dtype=numpy.int64) % size
+        cols = numpy.asarray(cols, dtype=numpy.int64) % size
+        flat, first = numpy.unique(rows*size + cols, return_index=True)
+        values = numpy.broadcast_to(numpy.asarray(values, dtype=float), rows.shape)[first]
+        rows, cols = numpy.divmod(flat, size)
+        if self.storage == "sparse" or (self.storage == "auto" and flat.size < self.sparse_threshold * size**2 and _scipy_sparse() is not None):
+            self.W = _scipy_sparse().csr_matrix((values, (rows, cols)), shape=(size, size))
+            self.sparse = True
+        else:
+            self.W = numpy.zeros((size, size))
+            self.W[rows, cols] = values
+            self.sparse = False
         return
     
     def _init_ring(self):
@@ -105,221 +258,622 @@ class TinyESN():
         """
         # A "Sparsely connected ring" is a ring that has three connections per node, and that in addition has a few connections between other nodes
         # It is perhaps a misnomer, as it has more connections than a ring
-        placeholder = numpy.zeros((self.x.size, self.x.size), dtype=numpy.int8)
-        for i in range(self.x.size):
-            coordinates = [(i, i, i), ((i-1)%self.x.size, i, (i+1)%self.x.size)]
-            placeholder[tuple(coordinates)] = 1
+        size = self.x.size
+        if self.storage == "stencil":
+            self.W = Stencil.neighbourhood((size,), RING, periodic=True)
+            return
+        nodes = numpy.arange(size)
+        rows = numpy.concatenate((nodes, nodes, nodes))
+        cols = numpy.concatenate(((nodes-1)%size, nodes, (nodes+1)%size))
         #the following only has an effect if the connectivity > 0, because otherwise no_of_additional_weights = 0
-        no_of_additional_weights = int(self.connectivity * (self.x.size**2))
-        weights = numpy.ones(no_of_additional_weights, dtype=numpy.int8)
-        add_placeholder = numpy.append(numpy.zeros(self.x.size**2 - no_of_additional_weights, dtype=numpy.int8), weights)
-        add_placeholder = numpy.random.permutation(placeholder).reshape((self.x.size, self.x.size))
-        print(placeholder)
-        print(add_placeholder)
-        self.W = numpy.bitwise_or(placeholder, add_placeholder)
+        no_of_additional_weights = int(self.connectivity * (size**2))
+        additional = self._sample_positions(no_of_additional_weights)
+        self._assemble(numpy.append(rows, additional // size), numpy.append(cols, additional % size), 1)
         return
     
     def _init_lattice(self):
         """
-        Initialise the ESN with a lattice topology. ]
+        Initialise the ESN with a lattice topology.
 
-        For this to work, the number of nodes N must be a square number, or else the function will return an error.
+        The nodes form a grid of shape grid_shape (a square by default, in which case the number of nodes N must be a square number, or else the function will return an error).
 
         From [2]: With this topology, we define a square grid of neurons each connected to its nearest neighbours (using its Moore neighbourhood, as commonly used in cellular automata). Each non-perimetre node has eight connections and one self-connection, resulting with each node having a maximum of nine adaptable weights in W.
 
         This topology aims to imitate the layout of physical materia.
         """
-        if numpy.sqrt(self.x.size) != int(numpy.sqrt(self.x.size)):
-            raise ValueError("Can only form a lattice if nodes can form a square.")
-        s = self.x.size
-        side = int(numpy.sqrt(s))
-        placeholder = numpy.zeros((s, s))
-        edge_big = lambda a, b, c: a if a<c else b
-        edge_small = lambda a, b, c: a if a>=c else b
-        col_count = 0
-        row_count = 1
-        for i in range(s):
-            if col_count == side and row_count!=5:
-                col_count = 0
-                row_count+=1
-            col_count+=1
-            #this awful (affectionate) piece of code is the moore neighbourhood for any given node i
-            #i pity the person to try and modify this to work as a rectangle (i am so sorry)
-            coordinates = [(i, edge_big(i+side, i, s), edge_big(i+1, i, (side*row_count)), edge_big((i+1+side), i, min(s, (side*(row_count+1)))), edge_small(i-side, i, 0), edge_small(i-1, i, side*(row_count-1)), edge_small(i-side-1, i, max(0, side*(row_count-2))), edge_small(edge_big(i-side+1, i, side*(row_count-1)), i, 0), edge_big(edge_small(i+side-1, i, side*(row_count)),i,s)), (i, i, i, i, i, i, i, i, i)]
-            # print(edge_big(i-side+1, i, side*(row_count-1)))
-            # print(coordinates)
-            placeholder[tuple(coordinates)] = 1
-        
-        self.W = placeholder
+        if self.storage == "stencil":
+            self.W = Stencil.neighbourhood(self.grid_shape, MOORE, periodic=False)
+            return
+        neighbours, nodes = self._grid_neighbourhoods(periodic=False)
+        self._assemble(neighbours, nodes, 1)
         return
 
     def _init_torus(self):
         """
-        Initialise the ESN with a lattice topology.
+        Initialise the ESN with a torus topology.
 
-        For this to work, the number of nodes N must be a square number, or else the function will return an error. 
+        The nodes form a grid of shape grid_shape (a square by default, in which case the number of nodes N must be a square number, or else the function will return an error).
 
         From [2]: The torus topology is a special case of the latice where the perimetre nodes are connected to give periodic boundary conditions. Each node has nine adaptable weights in W.
         """
-        if numpy.sqrt(self.x.size) != int(numpy.sqrt(self.x.size)):
-            raise ValueError("Can only form a torus if nodes can form a square.")
-        s = self.x.size
-        side = int(numpy.sqrt(s))
-        placeholder = numpy.zeros((s, s))
-        edge_big = lambda a, b, c: a if a<c else b
-        edge_small = lambda a, b, c: a if a>=c else b
-        col_count = 0
-        row_count = 1
-        for i in range(s):
-            if col_count == side and row_count!=side :
-                col_count = 0
-                row_count+=1
-            col_count+=1
-            # you cannot hate me more than i hate myself
-            #i pity the person to try and modify this to work as a rectangle (i am so sorry)
-            coordinates = [(i, (i+side)%s, edge_big(i+1, i-(side-1), row_count*side), int(edge_big((i+1+side), (i+1), ((row_count+1)*side)))%s, i-side, edge_small(i-1, (row_count*side)-1, side*(row_count-1)), edge_small(i-side-1, i-1, (row_count-2)*side), edge_big(i-side+1, (row_count-2)*side, side*(row_count-1)), edge_small(i+side-1, side*(row_count+1)-1, side*(row_count))%s), (i, i, i, i, i, i, i, i, i)]
-            # print(edge_big(i-side+1, i, side*(row_count-1)))
-            # print(coordinates)
-            placeholder[tuple(coordinates)] = 1
-        
-        self.W = placeholder
+        if self.storage == "stencil":
+            self.W = Stencil.neighbourhood(self.grid_shape, MOORE, periodic=True)
+            return
+        neighbours, nodes = self._grid_neighbourhoods(periodic=True)
+        self._assemble(neighbours, nodes, 1)
         return
 
+    def _grid_neighbourhoods(self, periodic):
+        """
+        Get the Moore neighbourhood (including the node itself) of every node of the grid, for all nodes at once.
+
+        periodic: whether the edges of the grid wrap around (torus) or not (lattice).
+
+        returns the indices of the neighbours and the indices of the nodes they are connected to.
+        """
+        rows, cols = self.grid_shape
+        nodes = numpy.arange(rows*cols)
+        row, col = numpy.divmod(nodes, cols)
+        neighbours = []
+        connected = []
+        for row_offset in (-1, 0, 1):
+            for col_offset in (-1, 0, 1):
+                neighbour_row = row + row_offset
+                neighbour_col = col + col_offset
+                if periodic:
+                    neighbours.append((neighbour_row % rows)*cols + neighbour_col % cols)
+                    connected.append(nodes)
+                else:
+                    inside = (neighbour_row >= 0) & (neighbour_row < rows) & (neighbour_col >= 0) & (neighbour_col < cols)
+                    neighbours.append(neighbour_row[inside]*cols + neighbour_col[inside])
+                    connected.append(nodes[inside])
+        return numpy.concatenate(neighbours), numpy.concatenate(connected)
+
     def _init_complete(self):
         """Initialise an ESN with a fully-connected topology."""
-        placeholder = numpy.ones_like(self.W)
-        self.W = placeholder
+        size = self.x.size
+        placeholder = numpy.ones((size, size))
+        if self.storage == "sparse":
+            self.W = _scipy_sparse().csr_matrix(placeholder)
+            self.sparse = True
+        else:
+            self.W = placeholder
         return
 
     def has_echo_state(self):
         """Look at the values of the spectral radius and largest singular value to guess if the ESN has the echo state property[1]."""
-        absolute = numpy.vectorize(abs)
-        abs_eigen_vals = absolute(numpy.linalg.eig(self.W))
-        spectral_radius = max(abs_eigen_vals)
-        single_vals = numpy.linalg.svd(self.W)
-        lsv = max(single_vals)
-        #calculate spectral radius
-        #check the "largest singular value"
+        spectral_radius = self._spectral_value("radius")
+        lsv = self._spectral_value("singular")
         print(f"spectral radius: {spectral_radius}\nlargest singular value:{lsv}")
         return lsv > 1 and spectral_radius < 1
 
     def _increment_timestep(self, data):
         """Increment timestep according to the protocol chosen in init."""
+        self.run(numpy.reshape(data, (1, self.u.size)))
+        return
+
+    def _as_dataset(self, data):
+        """Turn a dict of form {input: target output} into a Dataset."""
+        return data if isinstance(data, Dataset) else Dataset.from_dict(data)
 
+    def _as_inputs(self, inputs):
+        """Turn a sequence of inputs (such as the keys of a training set) into a (T, K) array."""
+        return numpy.asarray(inputs, dtype=self.dtype).reshape((-1, self.u.size))
+
+    def run(self, inputs, return_outputs=False):
+        """
+        Run the reservoir over a whole input sequence, using the update protocol chosen in init.
+
+        inputs: array of shape (T, K), or anything that can be reshaped to it (such as a list of T inputs).
+        return_outputs (default False): whether to also return the (T, L) outputs of the ESN.
+
+        returns the (T, N) states of the reservoir after each timestep (and the outputs if asked).
+
+        The instantaneous update is the one defined in [1]: the new state is driven by the current input and the output is read from the new state.
+        The discretised update is the one described in [3]: the new state is driven by the previous input, and the output is read from the previous state.
+        With feedback, the previous output is also fed back into the reservoir through Wback.
+        With a state_cache, the states (and outputs with feedback) are read-only arrays shared with the cache.
+        """
+        probe = self.instrumentation
+        kernel = self._run if self.state_cache is None else self._run_cached
+        if probe is None:
+            return kernel(self._prepare_inputs(inputs), return_outputs)
+        with probe.phase("data"):
+            inputs = self._prepare_inputs(inputs)
+        with probe.phase("update"):
+            if probe.has_step_hooks():
+                result = self._run_hooked(inputs, return_outputs, probe)
+            else:
+                result = kernel(inputs, return_outputs)
+        arrays = result if return_outputs else (result,)
+        probe.steps += len(arrays[0])
+        probe.count_allocation(*arrays)
+        return result
+
+    def _prepare_inputs(self, inputs):
+        """Turn inputs into a (T, K) array, normalised if input_norm is set."""
+        inputs = self._as_inputs(inputs)
         if self.input_norm:
-            v_tanh = numpy.vectorize(numpy.tanh)
-            data = v_tanh(data)
-        data = numpy.array([data]).reshape(self.u.shape)
-        if self.mode == "discretised" and self.feedback is True:
-            self._increment_timestep_fb_discretised(data)
-        elif self.mode == "discretised" and self.feedback is False:
-            self._increment_timestep_no_fb_discretised(data)
-        elif self.mode == "instantaneous" and self.feedback is True:
-            self._increment_fb_inst(data)
-        else:
-            self._increment_timestep_no_fb_inst(data)
-        return
+            inputs = numpy.tanh(inputs)
+        return inputs
+
+    def _run_hooked(self, inputs, return_outputs, probe):
+        """Run the reservoir one timestep at a time, calling the step hooks of probe around every timestep."""
+        if len(inputs) == 0:
+            return self._run(inputs, return_outputs)
+        states = []
+        outputs = []
+        for u in inputs:
+            probe.emit("pre_step", self, self.t, u)
+            result = self._run(u[numpy.newaxis], return_outputs)
+            if return_outputs:
+                outputs.append(result[1])
+                result = result[0]
+            states.append(result)
+            probe.emit("post_step", self, self.t - 1, result[0])
+        states = numpy.concatenate(states)
+        return (states, numpy.concatenate(outputs)) if return_outputs else states
+
+    def _run(self, inputs, return_outputs):
+        """Run the reservoir over a (T, K) array of already normalised inputs (see run)."""
+        steps = inputs.shape[0]
+        states = numpy.empty((steps, self.x.size), dtype=numpy.result_type(self.W.dtype, self.Wu.dtype, self.x.dtype))
+        outputs = None
+        if return_outputs or self.feedback:
+            outputs = numpy.empty((steps, self.v.size), dtype=states.dtype)
+        if steps == 0:
+            return (states, outputs) if return_outputs else states
+        x0 = self.x[:, 0]
+        x, v = engines.get(self.engine).simulate(self, inputs, states, outputs)
+        if not self.feedback:
+            v = self._read_states(states, x0, outputs)
+        self.x = numpy.reshape(x, (self.x.size, 1))
+        self.u = numpy.reshape(inputs[-1], (self.u.size, 1))
+        self.v = numpy.reshape(v, (self.v.size, 1))
+        self.t += steps
+        return (states, outputs) if return_outputs else states
+
+    def _read_states(self, states, x0, outputs=None):
+        """
+        Read the outputs of a run without feedback from its (T, N) states, the reservoir having started the run from the (N,) state x0.
 
-    def _increment_timestep_no_fb_inst(self, data):
-        """Update the ESN state and outputs according to the instantaneous equation defined in [1]. Does not take feedback into account."""
-        self.u = data
-        self.x = self.func(numpy.dot(self.W, self.x) + numpy.dot(self.Wu, self.u)) 
-        self.v = self.func(numpy.dot(self.Wv, self.x))
-        self.t += 1
-        return
-    
-    def _increment_fb_inst(self, data):
-        """Update the ESN state and outputs according to the instantaneous equation defined in [1]. Takes feedback into account."""
-        self.u = data
-        self.x = self.func(numpy.dot(self.W, self.x) + numpy.dot(self.Wu, self.u) + numpy.dot(self.Wback, self.v))
-        self.v = self.func(numpy.dot(self.x, self.Wv))
-        self.t += 1
+        outputs (default None): (T, L) array the outputs are written to. With None only the last output is computed.
+
+        returns the (L,) last output.
+        """
+        Wv, func = self.Wv, self.func
+        instantaneous = self.mode == "instantaneous"
+        if outputs is not None:
+            if instantaneous:
+                outputs[:] = func(numpy.dot(states, Wv.T))
+            else:
+                outputs[0] = func(numpy.dot(Wv, x0))
+                outputs[1:] = func(numpy.dot(states[:-1], Wv.T))
+            return outputs[-1]
+        if instantaneous:
+            return func(numpy.dot(Wv, states[-1]))
+        return func(numpy.dot(Wv, states[-2] if len(states) > 1 else x0))
+
+    def get_state(self):
+        """Get a copy of the current (x, u, v, t) state of the ESN, which set_state can go back to."""
+        return self.x.copy(), self.u.copy(), self.v.copy(), self.t
+
+    def set_state(self, state):
+        """
+        Put the ESN back in a state returned by get_state.
+
+        Running the same inputs again from the same state gives the same states, so with a state_cache the second run is read from the cache
+        (such as to train again with another ridge, or on other targets over the same inputs).
+        """
+        x, u, v, t = state
+        self.x = numpy.array(x, dtype=self.dtype).reshape(self.x.shape)
+        self.u = numpy.array(u, dtype=self.dtype).reshape(self.u.shape)
+        self.v = numpy.array(v, dtype=self.dtype).reshape(self.v.shape)
+        self.t = t
         return
-    
-    def _increment_timestep_no_fb_discretised(self, data):
-        """Update the ESN state and ouputs according to the discretised equation described in [3]. Does not take feedback into account."""
-        new_x = self.func(numpy.dot(self.W, self.x) + numpy.dot(self.Wu, self.u)) 
-        # print(f"Wv: {self.Wv.shape},\nx: {self.x.shape}")
-        self.v = self.func(numpy.dot(self.Wv, self.x))
-        self.x = new_x
-        self.u = data
-        self.t += 1
+
+    def reset_state(self):
+        """Put the ESN back in the state it was created (or loaded) in."""
+        self.set_state(self.initial_state)
         return
 
-    def _increment_timestep_fb_discretised(self, data):
-        """Update the ESN state and outputs according to the discretised equation described in [3]. Takes feedback into account."""
-        # incorporates feedback of the output
-        new_x = self.func(numpy.dot(self.W, self.x) + numpy.dot(self.Wu, self.u) + numpy.dot(self.Wback, self.v))
-        self.v = self.func(numpy.dot(self.x, self.Wv))
-        self.x = new_x
-        self.u = data
-        self.t += 1
+    def _run_cached(self, inputs, return_outputs):
+        """
+        Run the reservoir through self.state_cache: the states of a sequence already run from the same state are read back instead of simulated.
+
+        Without feedback the states do not depend on the readout, so only the outputs are computed again, with the current Wv.
+        Every run moves the state on, so running the same sequence again only hits the cache after set_state or reset_state.
+        """
+        if len(inputs) == 0:
+            return self._run(inputs, return_outputs)
+        cache = self.state_cache
+        key = cache.key(self, inputs)
+        entry = cache.get(key)
+        if entry is None:
+            result = self._run(inputs, return_outputs or self.feedback)
+            states, outputs = result if return_outputs or self.feedback else (result, None)
+            cache.put(key, {"states": states, "outputs": outputs if self.feedback else None, "x": self.x.copy(), "u": self.u.copy(), "v": self.v.copy()})
+            return (states, outputs) if return_outputs else states
+        states, outputs = entry["states"], entry.get("outputs")
+        x0 = self.x[:, 0]
+        self.x = numpy.array(entry["x"])
+        self.u = numpy.array(entry["u"])
+        if self.feedback:
+            self.v = numpy.array(entry["v"])
+        else:
+            outputs = numpy.empty((len(states), self.v.size), dtype=states.dtype) if return_outputs else None
+            self.v = numpy.reshape(self._read_states(states, x0, outputs), (self.v.size, 1))
+        self.t += len(states)
+        return (states, outputs) if return_outputs else states
+
+    def save(self, path):
+        """
+        Save the weights, state and configuration of the ESN to an uncompressed .npz file.
+
+        path: path of the file to write.
+
+        The update function is saved by name if it is a numpy ufunc (such as numpy.tanh). Any other function has to be given again to load.
+        """
+        arrays = {"Wu": self.Wu, "Wv": self.Wv, "Wback": self.Wback, "x": self.x, "u": self.u, "v": self.v}
+        if self.sparse:
+            arrays.update({"W_data": self.W.data, "W_indices": self.W.indices, "W_indptr": self.W.indptr})
+        elif self.storage == "stencil":
+            arrays.update({"W_weights": self.W.weights, "W_offsets": numpy.array(self.W.offsets)})
+        else:
+            arrays["W"] = self.W
+        f = self.f if isinstance(self.f, numpy.ufunc) and getattr(numpy, self.f.__name__, None) is self.f else None
+        config = {"f": None if f is None else f.__name__,
+                  "mode": self.mode,
+                  "feedback": self.feedback,
+                  "topology": self.topology,
+                  "connectivity": self.connectivity,
+                  "grid_shape": self.grid_shape,
+                  "input_norm": self.input_norm,
+                  "storage": self.storage,
+                  "sparse_threshold": self.sparse_threshold,
+                  "sparse": self.sparse,
+                  "dtype": self.dtype.name,
+                  "engine": self.engine,
+                  "spectral_method": self.spectral_method,
+                  "spectral": self._spectral,
+                  "t": self.t}
+        arrays["config"] = numpy.array(json.dumps(config))
+        with open(path, "wb") as f:
+            numpy.savez(f, **arrays)
         return
 
+    @classmethod
+    def load(cls, path, mmap=False, f=None):
+        """
+        Load an ESN saved with save, without rebuilding or rescaling its weights.
+
+        path: path of the .npz file.
+        mmap (default False): whether to memory-map the weight matrices read-only instead of reading them, so that processes loading the same file share its pages.
+        f (default None): update function, needed if the ESN was saved with a function that is not a numpy ufunc.
+        """
+        with numpy.load(path) as archive:
+            config = json.loads(str(archive["config"]))
+            weights = [name for name in archive.files if name.startswith("W")]
+            arrays = {name: archive[name] for name in archive.files if name not in weights}
+            if not mmap:
+                arrays.update({name: archive[name] for name in weights})
+        if mmap:
+            arrays.update(_memmap_npz(path, weights))
+        if f is None:
+            if config["f"] is None:
+                raise ValueError("please give the update function this ESN was saved with")
+            f = getattr(numpy, config["f"])
+        esn = cls.__new__(cls)
+        esn.grid_shape = None if config["grid_shape"] is None else tuple(config["grid_shape"])
+        for name in ["mode", "feedback", "topology", "connectivity", "input_norm", "storage", "sparse_threshold", "sparse", "spectral_method"]:
+            setattr(esn, name, config[name])
+        esn._spectral = config["spectral"]
+        esn.dtype = numpy.dtype(config.get("dtype", "float64"))
+        esn.engine = config.get("engine", "numpy")
+        esn.rng = numpy.random.default_rng()
+        esn.f = f
+        esn.func = f if isinstance(f, numpy.ufunc) else numpy.vectorize(f)
+        esn.instrumentation = None
+        esn.state_cache = None
+        esn._init_runtime()
+        esn.t = config["t"]
+        esn.x = numpy.array(arrays["x"])
+        esn.u = numpy.array(arrays["u"])
+        esn.v = numpy.array(arrays["v"])
+        esn.Wu = arrays["Wu"]
+        esn.Wv = arrays["Wv"]
+        esn.Wback = arrays["Wback"]
+        if esn.sparse:
+            size = esn.x.size
+            esn.W = _scipy_sparse().csr_matrix((arrays["W_data"], arrays["W_indices"], arrays["W_indptr"]), shape=(size, size), copy=False)
+        elif esn.storage == "stencil":
+            esn.W = Stencil(esn.grid_shape or (esn.x.size,), arrays["W_offsets"], arrays["W_weights"])
+        else:
+            esn.W = arrays["W"]
+        esn.initial_state = esn.get_state()
+        return esn
+
     def pretty_print(self):
-        """Pretty print the reservoir."""
-        g = igraph.Graph.Weighted_Adjacency(self.W, loops=False)
+        """Pretty print the reservoir. Needs python-igraph, which is only imported here so that the rest of the ESN only depends on numpy."""
+        import igraph
+        g = igraph.Graph.Weighted_Adjacency(self.W.toarray() if hasattr(self.W, "toarray") else self.W, loops=False)
         if self.topology == "ring":
             layout = g.layout_circle()
         elif self.topology == "lattice":
-            layout = g.layout_grid()
+            layout = g.layout_grid(width=self.grid_shape[1])
         elif self.topology == "torus":
-            layout = g.layout_grid()
+            layout = g.layout_grid(width=self.grid_shape[1])
         else: 
             layout = g.layout_kamada_kawai()
         igraph.plot(g, layout=layout)
         return
 
-    def train_pseudoinverse(self, training_set):
+    def train_pseudoinverse(self, training_set, ridge=0.0, record_outputs=False, washout=10):
         """
         Train the Output Weight matrix using the pseudo-inverse method descirbed in [4].
 
-        training_set: Dict of the training set, of form {input: target output}.
-        
-        Note: [4] describes this method as "it is expensive memory-wise for large design matrices [self.x]". That being said, given the scale of this ESN, it is perhaps the most straightforward option, as it is very simple to understand.
-        """
-        # make sure that the size of th
-
-        if list(training_set.values())[0].size != self.v.size:
-            raise ValueError(f"please make sure your ESN outputs match your training set: {list(training_set.values())[0].size}, {self.v.size}")
-        for data in training_set:
-            self._increment_timestep(data)
-            if self.t <= 10:
-                pass
-            elif self.M_train is None:
-                self.M_train = self.x # note: here i am going by the assumption that numpy is doign assign by value, not by reference, which as far as I can tell is true
-                # print(f"M (pre-reshape): {self.M_train.shape}")
-                self.M_train = numpy.transpose(self.M_train)
-                self.D_train = numpy.ndarray(shape=self.v.shape, buffer=training_set[data]).T #...what the fuck is this code even doing
-                self.outputs = self.v
-                # print(f"M = {self.M_train.shape},\n D={self.D_train.shape},\n M+={numpy.linalg.pinv(self.M_train).shape}")
-                self.Wv = numpy.transpose(numpy.dot(numpy.linalg.pinv(self.M_train), self.D_train))
-            else:
-                # print(self.M_train.size)
-                y = self.x
-                y = numpy.transpose(y)
-                self.M_train = numpy.vstack((self.M_train, y))
-                self.D_train = numpy.vstack((self.D_train, training_set[data]))
-                self.outputs = numpy.vstack((self.outputs, self.v))
-                # print(f"M = {self.M_train.shape},\n D={self.D_train.shape},\n M+={numpy.linalg.pinv(self.M_train).shape}")
-                # this is broken right here
-                self.Wv = numpy.transpose(numpy.dot(numpy.linalg.pinv(self.M_train), self.D_train)) #Note: the output matrix derived with this method gives a transposition of the weight matrix described in [1], hence the transposition here
+        training_set: Dataset of the training set (a dict of form {input: target output} also works).
+        ridge (default 0.0): Tikhonov regularisation factor. With 0 the readout is the plain pseudo-inverse solution.
+        record_outputs (default False): whether to keep the harvested states, so that self.outputs can hold the outputs of the trained readout. The states then take O(T*N) memory.
+        washout (default 10): number of initial timesteps left out of the training.
+
+        Rather than keeping the whole design matrix [4], only the R factor of its QR decomposition and Q^T D are accumulated, in O(N^2) memory (see readout.py),
+        and Wv is solved for once at the end. It is the same readout as the pseudo-inverse of the design matrix, whether or not the states are kept.
+        """
+        with self._phase("data"):
+            training_set = self._as_dataset(training_set)
+        self.reset_readout()
+        harvested = None
+        if record_outputs:
+            harvested = numpy.empty((max(len(training_set) - washout, 0), self.x.size), dtype=self.dtype)
+        for start, states in self._harvest(training_set.chunks(self._training_block), washout):
+            if harvested is not None:
+                harvested[start - washout:start - washout + len(states)] = states
+        self.solve_readout(ridge)
+        if harvested is not None:
+            self.outputs = self.func(numpy.dot(harvested, self.Wv.T))
+        if self.instrumentation is not None:
+            self.instrumentation.count_allocation(harvested, self.outputs if record_outputs else None)
+            self.instrumentation.emit("post_train", self)
         return
 
+    def train_chunks(self, chunks, ridge=0.0, washout=10):
+        """
+        Train the Output Weight matrix on a sequence read a chunk at a time, for sequences too long to be held in memory.
+
+        chunks: iterable of (inputs, targets) pairs holding consecutive parts of the sequence (such as a generator reading a log file),
+        or a Dataset (such as one of memory-mapped arrays), which is then read self._training_block timesteps at a time.
+        ridge (default 0.0): Tikhonov regularisation factor. With 0 the readout is the plain pseudo-inverse solution.
+        washout (default 10): number of initial timesteps of the whole sequence left out of the training.
+
+        The reservoir state carries over from one chunk to the next, so the readout is the same as if the whole sequence had been given to train_pseudoinverse.
+        Only the R factor of the states and Q^T D are kept from one chunk to the next, so memory use is O(N^2 + chunk*N) whatever the length of the sequence.
+        Unlike train_pseudoinverse, self.outputs is not set.
+        """
+        if isinstance(chunks, Dataset):
+            chunks = chunks.chunks(self._training_block)
+        self.reset_readout()
+        for _ in self._harvest(chunks, washout):
+            pass
+        self.solve_readout(ridge)
+        if self.instrumentation is not None:
+            self.instrumentation.emit("post_train", self)
+        return
+
+    def _harvest(self, chunks, washout):
+        """
+        Run the reservoir over consecutive chunks of (inputs, targets), folding the states past the washout into the readout statistics.
+
+        yields the index of the first kept timestep of every chunk, and the kept states.
+        """
+        start = 0
+        for chunk in chunks:
+            inputs, targets = (chunk.inputs, chunk.targets) if isinstance(chunk, Dataset) else chunk
+            targets = numpy.asarray(targets)
+            targets = targets.reshape((len(targets), -1))
+            if targets.shape[1] != self.v.size:
+                raise ValueError(f"please make sure your ESN outputs match your training set: {targets.shape[1]}, {self.v.size}")
+            states = self.run(inputs)
+            if len(states) != len(targets):
+                raise ValueError(f"Found input variables with inconstitent numbers of samples [{len(states)}, {len(targets)}]")
+            skip = max(washout - start, 0)
+            if skip < len(states):
+                self.accumulate_readout(states[skip:], targets[skip:])
+                yield start + skip, states[skip:]
+            start += len(states)
+        return
+
+    def reset_readout(self):
+        """Clear the statistics accumulated for the readout."""
+        self.R, self.QtD = readout.empty(self.x.size, self.v.size)
+        return
+
+    def accumulate_readout(self, states, targets):
+        """Fold a (T, N) block of states and their (T, L) target outputs into the R factor of the states and Q^T D."""
+        with self._phase("accumulate"):
+            states = numpy.asarray(states, dtype=numpy.float64).reshape((-1, self.x.size))
+            targets = numpy.asarray(targets, dtype=numpy.float64).reshape((-1, self.v.size))
+            self.R, self.QtD = readout.update(self.R, self.QtD, states, targets)
+        return
+
+    def solve_readout(self, ridge=0.0):
+        """
+        Solve for the Output Weight matrix from the statistics accumulated so far.
+
+        ridge (default 0.0): Tikhonov regularisation factor. With 0 the readout is the pseudo-inverse solution of the design matrix.
+        """
+        with self._phase("solve"):
+            Wv = readout.solve(self.R, self.QtD, ridge)
+        self.Wv = numpy.transpose(Wv).astype(self.dtype) #Note: the output matrix derived with this method gives a transposition of the weight matrix described in [1], hence the transposition here
+        return self.Wv
+
     def test(self, testing_set):
         """
         Test the ESN.
 
-        testing_set: Dict of testing values of form {input: target_output}.
+        testing_set: Dataset of testing values (a dict of form {input: target_output} also works).
         """
-        # print(self.Wv)
-        self._increment_timestep(list(testing_set.keys())[0])
-        self.outputs = self.v
-        for data in list(testing_set.keys())[1:]:
-            self._increment_timestep(data)
-            self.outputs = numpy.vstack((self.outputs, self.v))
+        _, self.outputs = self.run(self._as_dataset(testing_set).inputs, return_outputs=True)
         return 
 
+    def predict_step(self, u):
+        """
+        Feed a single input to the ESN and get its output, for online use of a trained ESN.
+
+        u: input of the timestep (a number, or anything holding K values).
+
+        returns the (L,) output. It is a buffer that the next call overwrites, so copy it if you need to keep it.
+
+        The update kernel is picked once, and every product is written into preallocated buffers, so a dense ESN with a ufunc update function does not allocate per step.
+        The state stays shared with self.x, self.u and self.v, so predict_step can be mixed with run and test.
+        """
+        serving = self._serving
+        if serving is None or self.x is not serving.x_view or self.u is not serving.u_view or self.v is not serving.v_view:
+            serving = self._prepare_serving()
+        serving.input[:] = u
+        if self.input_norm:
+            numpy.tanh(serving.input, out=serving.input)
+        probe = self.instrumentation
+        if probe is None:
+            serving.step(serving)
+        else:
+            probe.emit("pre_step", self, self.t, serving.input)
+            with probe.phase("update"):
+                serving.step(serving)
+            probe.steps += 1
+            probe.emit("post_step", self, self.t, serving.x)
+        self.t += 1
+        return serving.v
+
+    def predict_stream(self, inputs):
+        """
+        Feed inputs to the ESN one at a time, as they arrive.
+
+        inputs: iterable of inputs (such as a generator of sensor samples).
+
+        yields a copy of the (L,) output of every timestep.
+        """
+        for u in inputs:
+            yield self.predict_step(u).copy()
+
+    def forecast(self, inputs, starts, horizon: int):
+        """
+        Forecast a series in closed loop from several points of it at once, feeding every output back as the next input.
+
+        inputs: (T, K) observed series the reservoir is driven by (teacher forced) up to the start points, as run would. K must equal L.
+        starts: the B timesteps of inputs to forecast from.
+        horizon: number H of timesteps to forecast.
+
+        returns the (B, H, L) forecasts. forecasts[b, 0] is the output of the ESN at timestep starts[b], the one test would give,
+        and every later forecast is made by feeding the previous one back as the input.
+        The B trajectories are forked from the states of one run over inputs, and advanced together as (N, B) state columns.
+        The state of the ESN is left as it was.
+        """
+        if self.u.size != self.v.size:
+            raise ValueError("please make sure your ESN has as many inputs as outputs, so that its outputs can be fed back as inputs")
+        starts = numpy.asarray(starts, dtype=int).reshape(-1)
+        saved = (self.x, self.u, self.v, self.t)
+        try:
+            end = int(starts.max()) + 1 if starts.size else 0
+            normalised = self._prepare_inputs(inputs)[:end]
+            states, outputs = self._run(normalised, True)
+        finally:
+            self.x, self.u, self.v, self.t = saved
+        x = states[starts].T
+        u = normalised[starts].T
+        v = outputs[starts].T
+        forecasts = numpy.empty((starts.size, horizon, self.v.size), dtype=outputs.dtype)
+        if horizon > 0:
+            forecasts[:, 0] = v.T
+        for h in range(1, horizon):
+            fed = numpy.tanh(v) if self.input_norm else v
+            x, u, v = self._step_columns(x, u, v, fed)
+            forecasts[:, h] = v.T
+        return forecasts
+
+    def _step_columns(self, x, u, v, inputs):
+        """
+        Advance B reservoirs sharing the weights of this ESN by one timestep, using the update protocol chosen in init.
+
+        x, u, v: (N, B) states, (K, B) previous inputs and (L, B) previous outputs of the reservoirs.
+        inputs: (K, B) normalised inputs of the timestep.
+
+        returns the new x, u and v.
+        """
+        func = self.func
+        if self.mode == "instantaneous":
+            pre = self.W @ x + numpy.dot(self.Wu, inputs)
+            if self.feedback:
+                pre += numpy.dot(self.Wback, v)
+            x = func(pre)
+            v = func(numpy.dot(self.Wv, x))
+        else:
+            pre = self.W @ x + numpy.dot(self.Wu, u)
+            if self.feedback:
+                pre += numpy.dot(self.Wback, v)
+            v = func(numpy.dot(self.Wv, x))
+            x = func(pre)
+        return x, inputs, v
+
+    def _prepare_serving(self):
+        """Allocate the buffers used by predict_step, copy the current state into them, and pick the update kernel."""
+        dtype = numpy.result_type(self.W.dtype, self.Wu.dtype, self.Wv.dtype, self.Wback.dtype, self.x.dtype)
+        serving = types.SimpleNamespace()
+        serving.x = numpy.array(self.x[:, 0], dtype=dtype)
+        serving.u = numpy.array(self.u[:, 0], dtype=dtype)
+        serving.v = numpy.array(self.v[:, 0], dtype=dtype)
+        serving.input = numpy.empty(self.u.size, dtype=dtype)
+        serving.pre = numpy.empty(self.x.size, dtype=dtype)
+        serving.drive = numpy.empty(self.x.size, dtype=dtype)
+        serving.ufunc = isinstance(self.func, numpy.ufunc)
+        serving.step = self._serve_instantaneous if self.mode == "instantaneous" else self._serve_discretised
+        serving.x_view = self.x = serving.x.reshape((self.x.size, 1))
+        serving.u_view = self.u = serving.u.reshape((self.u.size, 1))
+        serving.v_view = self.v = serving.v.reshape((self.v.size, 1))
+        if self.instrumentation is not None:
+            self.instrumentation.count_allocation(serving.x, serving.u, serving.v, serving.input, serving.pre, serving.drive)
+        self._serving = serving
+        return serving
+
+    def _serve_activation(self, serving, pre, out):
+        """Apply the update function to pre, writing the result into out."""
+        if serving.ufunc:
+            self.func(pre, out=out)
+        else:
+            out[:] = self.func(pre)
+        return
+
+    def _serve_reservoir_input(self, serving, u):
+        """Write W x + Wu u (+ Wback v with feedback) into serving.pre."""
+        if not isinstance(self.W, numpy.ndarray):
+            serving.pre[:] = self.W @ serving.x
+        else:
+            numpy.dot(self.W, serving.x, out=serving.pre)
+        numpy.dot(self.Wu, u, out=serving.drive)
+        serving.pre += serving.drive
+        if self.feedback:
+            numpy.dot(self.Wback, serving.v, out=serving.drive)
+            serving.pre += serving.drive
+        return
+
+    def _serve_instantaneous(self, serving):
+        """predict_step kernel for the instantaneous update: the state is driven by the current input, and the output read from the new state."""
+        serving.u[:] = serving.input
+        self._serve_reservoir_input(serving, serving.u)
+        self._serve_activation(serving, serving.pre, serving.x)
+        numpy.dot(self.Wv, serving.x, out=serving.v)
+        self._serve_activation(serving, serving.v, serving.v)
+        return
+
+    def _serve_discretised(self, serving):
+        """predict_step kernel for the discretised update: the state is driven by the previous input, and the output read from the previous state."""
+        self._serve_reservoir_input(serving, serving.u)
+        numpy.dot(self.Wv, serving.x, out=serving.v)
+        self._serve_activation(serving, serving.v, serving.v)
+        self._serve_activation(serving, serving.pre, serving.x)
+        serving.u[:] = serving.input
+        return
+
 
 
 """
@@ -1,10 +1,18 @@
 from abc import ABC, abstractmethod
+import numpy
 
 class BenchMark(ABC):
+    rng = numpy.random.default_rng()
+
     @abstractmethod
     def create_training_set(self, size):
         pass
 
     @abstractmethod
     def reset(self):
-        pass
\ No newline at end of file
+        pass
+
+    def seed(self, seed=None):
+        """Give the benchmark its own random generator. seed can be anything numpy.random.default_rng accepts."""
+        self.rng = numpy.random.default_rng(seed)
+        return
@@ -0,0 +1,66 @@
+"""Array-backed container for the input and target sequences of a benchmark."""
+import numpy
+
+
+class Dataset():
+    """
+    Sequence of inputs and their target outputs.
+
+    inputs are stored as a (T, K) array and targets as a (T, L) array. Unlike a {input: target} dict, repeated inputs are kept,
+    and slicing a Dataset (or splitting it) gives views of the same arrays rather than copies.
+    """
+
+    def __init__(self, inputs, targets):
+        """
+        Initialise the dataset.
+
+        inputs: array of shape (T, K), or (T,) for a single input node.
+        targets: array of shape (T, L), or (T,) for a single output node.
+        """
+        inputs = numpy.asarray(inputs)
+        targets = numpy.asarray(targets)
+        if inputs.ndim == 1:
+            inputs = inputs[:, numpy.newaxis]
+        if targets.ndim == 1:
+            targets = targets[:, numpy.newaxis]
+        if len(inputs) != len(targets):
+            raise ValueError(f"Found input variables with inconstitent numbers of samples [{len(inputs)}, {len(targets)}]")
+        self.inputs = inputs.reshape((len(inputs), -1))
+        self.targets = targets.reshape((len(targets), -1))
+        return
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a dataset from a dict of form {input: target output}."""
+        inputs = numpy.asarray(list(data), dtype=float)
+        targets = numpy.asarray([numpy.ravel(target) for target in data.values()], dtype=float)
+        return cls(inputs.reshape((len(data), -1)), targets)
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def __getitem__(self, index):
+        """Get the (input, target) pair at an index, or a Dataset view for a slice."""
+        if isinstance(index, slice):
+            return Dataset(self.inputs[index], self.targets[index])
+        return self.inputs[index], self.targets[index]
+
+    def __iter__(self):
+        return zip(self.inputs, self.targets)
+
+    def chunks(self, size: int):
+        """Iterate over consecutive Dataset views of at most size timesteps, for reading a long (or memory-mapped) dataset a part at a time."""
+        for start in range(0, len(self), size):
+            yield self[start:start + size]
+
+    def split(self, at):
+        """Split the dataset in two views at index at."""
+        return self[:at], self[at:]
+
+    def items(self):
+        """Iterate over (input, target) pairs, as for a dict training set."""
+        return iter(self)
+
+    def values(self):
+        """Get the targets, as for a dict training set."""
+        return self.targets
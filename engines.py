@@ -0,0 +1,192 @@
+"""
+Engines running the timestep loop of TinyESN.run.
+
+The numpy engine is the reference implementation, and works for every ESN. The numba engine compiles the whole loop into one native kernel,
+which removes the interpreter overhead that dominates small reservoirs (a few hundred nodes or less). It needs numba, a dense W and numpy.tanh
+as update function, and falls back to the numpy engine otherwise.
+"""
+import copy
+import numpy
+
+
+def _numba():
+    """Import numba on first use. Returns None if it is not installed."""
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba
+
+
+class NumpyEngine():
+    """Reference engine: the timestep loop in python, with numpy products."""
+    name = "numpy"
+
+    def supports(self, esn):
+        """Whether the engine can run esn itself, rather than fall back to the numpy engine."""
+        return True
+
+    def simulate(self, esn, inputs, states, outputs):
+        """
+        Run the reservoir of esn over normalised inputs, from its current state, without changing the state of esn.
+
+        inputs: (T, K) array of normalised inputs, with T > 0.
+        states: (T, N) array the states after each timestep are written to.
+        outputs: (T, L) array the outputs are written to with feedback (without feedback the outputs do not drive the reservoir, and are read afterwards).
+
+        returns the last (N,) state, and with feedback the last (L,) output (without, the (L,) output the run started from).
+        """
+        instantaneous = esn.mode == "instantaneous"
+        feedback = esn.feedback
+        W, Wv, Wback, func = esn.W, esn.Wv, esn.Wback, esn.func
+        x = esn.x[:, 0]
+        v = esn.v[:, 0]
+        # the input drive of every timestep is computed in one go, the discretised update lags it by one step
+        drive = numpy.dot(inputs, esn.Wu.T)
+        previous = numpy.dot(esn.Wu, esn.u[:, 0])
+        for t in range(len(inputs)):
+            if instantaneous:
+                previous = drive[t]
+            pre = W @ x + previous
+            if feedback:
+                pre += numpy.dot(Wback, v)
+                if instantaneous:
+                    x = func(pre)
+                    v = func(numpy.dot(Wv, x))
+                else:
+                    v = func(numpy.dot(Wv, x))
+                    x = func(pre)
+                outputs[t] = v
+            else:
+                x = func(pre)
+            states[t] = x
+            previous = drive[t]
+        return x, v
+
+
+def _fused_loop(W, Wu, Wv, Wback, x0, u0, v0, inputs, states, outputs, instantaneous, feedback):
+    """
+    Timestep loop of NumpyEngine.simulate for the tanh update function, written with explicit loops so that numba compiles it to one kernel.
+
+    It is compiled with reassociation allowed, so that the sums over the nodes are vectorised. They are then added in a different order from BLAS.
+    """
+    N = x0.shape[0]
+    K = u0.shape[0]
+    L = v0.shape[0]
+    x = x0.copy()
+    v = v0.copy()
+    previous = u0.copy()
+    pre = numpy.empty(N, dtype=numpy.float64)
+    for t in range(inputs.shape[0]):
+        u = inputs[t] if instantaneous else previous
+        for i in range(N):
+            total = 0.0
+            for j in range(N):
+                total += W[i, j]*x[j]
+            for k in range(K):
+                total += Wu[i, k]*u[k]
+            if feedback:
+                for l in range(L):
+                    total += Wback[i, l]*v[l]
+            pre[i] = total
+        if feedback and not instantaneous:
+            for l in range(L):
+                total = 0.0
+                for j in range(N):
+                    total += Wv[l, j]*x[j]
+                v[l] = numpy.tanh(total)
+        for i in range(N):
+            x[i] = numpy.tanh(pre[i])
+        if feedback and instantaneous:
+            for l in range(L):
+                total = 0.0
+                for j in range(N):
+                    total += Wv[l, j]*x[j]
+                v[l] = numpy.tanh(total)
+        for i in range(N):
+            states[t, i] = x[i]
+        if feedback:
+            for l in range(L):
+                outputs[t, l] = v[l]
+        for k in range(K):
+            previous[k] = inputs[t, k]
+    return x, v
+
+
+class NumbaEngine():
+    """Engine running the whole timestep loop in a kernel compiled by numba (on first use, and cached on disk)."""
+    name = "numba"
+
+    def __init__(self):
+        self._kernel = None
+        self._available = None
+        return
+
+    def available(self):
+        """Whether numba is installed."""
+        if self._available is None:
+            self._available = _numba() is not None
+        return self._available
+
+    def supports(self, esn):
+        """Whether the engine can run esn itself, rather than fall back to the numpy engine."""
+        return esn.f is numpy.tanh and not esn.sparse and isinstance(esn.W, numpy.ndarray) and self.available()
+
+    def simulate(self, esn, inputs, states, outputs):
+        """Run the reservoir of esn over normalised inputs (see NumpyEngine.simulate)."""
+        if not self.supports(esn):
+            return ENGINES["numpy"].simulate(esn, inputs, states, outputs)
+        if self._kernel is None:
+            self._kernel = _numba().njit(cache=True, nogil=True, fastmath={"reassoc", "contract", "nsz"})(_fused_loop)
+        if outputs is None:
+            outputs = numpy.empty((0, esn.v.size), dtype=states.dtype)
+        dtype = states.dtype
+        arrays = [numpy.ascontiguousarray(array, dtype=dtype) for array in (esn.W, esn.Wu, esn.Wv, esn.Wback, esn.x[:, 0], esn.u[:, 0], esn.v[:, 0], inputs)]
+        return self._kernel(*arrays, states, outputs, esn.mode == "instantaneous", esn.feedback)
+
+    def __getstate__(self):
+        # the compiled kernel is compiled again (or read from the disk cache) by the processes an engine is sent to
+        return {"_kernel": None, "_available": None}
+
+
+ENGINES = {"numpy": NumpyEngine(), "numba": NumbaEngine()}
+
+
+def get(name):
+    """
+    Get an engine by name.
+
+    name: "numpy", "numba", or "auto" for numba when it is installed and numpy otherwise.
+    """
+    if name == "auto":
+        name = "numba" if ENGINES["numba"].available() else "numpy"
+    if name not in ENGINES:
+        raise ValueError("please set engine to numpy, numba or auto")
+    return ENGINES[name]
+
+
+def verify(esn, engine, inputs=None, steps=1000, seed=0):
+    """
+    Check an engine against the numpy reference engine, by running copies of esn with both over the same inputs.
+
+    esn: TinyESN to check. It is not modified.
+    engine: name of the engine to check.
+    inputs (default None): (T, K) inputs to run. None draws steps random inputs.
+    steps (default 1000): number of random inputs drawn if inputs is None.
+    seed (default 0): seed of the random inputs.
+
+    returns the largest absolute difference between the states and outputs of the two runs. Differences are expected at the level of
+    floating point rounding, since the compiled kernel sums the products in a different order from BLAS.
+    """
+    if inputs is None:
+        inputs = numpy.random.default_rng(seed).uniform(-1.0, 1.0, (steps, esn.u.size))
+    results = []
+    for name in ["numpy", engine]:
+        candidate = copy.copy(esn)
+        candidate.engine = name
+        candidate.state_cache = None
+        candidate.instrumentation = None
+        candidate._serving = None
+        states, outputs = candidate.run(inputs, return_outputs=True)
+        results.append((states, outputs, candidate.x, candidate.v))
+    return float(max(numpy.max(abs(reference - checked), initial=0.0) for reference, checked in zip(*results)))
@@ -0,0 +1,179 @@
+"""Simulate and train many same-sized ESNs at once."""
+import numpy
+import TinyESN
+import readout
+from dataset import Dataset
+
+
+def _batched(A, x):
+    """Multiply every matrix of the (R, n, m) stack A with the matching row of the (R, m) array x."""
+    return numpy.matmul(A, x[..., None])[..., 0]
+
+
+class TinyESNEnsemble():
+    """
+    Ensemble of R ESNs sharing the same sizes and update protocol.
+
+    The weights of the members are stacked into (R, N, N), (R, N, K), (R, L, N) and (R, N, L) arrays and their states into an (R, N) array,
+    so that every timestep advances the whole ensemble with one batched product, and the R readouts are trained with one batched solve.
+    """
+    _training_block = 4096 #number of timesteps harvested at a time when training
+
+    def __init__(self, esns):
+        """
+        Stack already initialised ESNs into an ensemble.
+
+        esns: list of TinyESN instances, which must all have the same K, N, L, update function, mode, feedback, input normalisation and dtype.
+        """
+        self.esns = list(esns)
+        first = self.esns[0]
+        for esn in self.esns:
+            if (esn.u.size, esn.x.size, esn.v.size) != (first.u.size, first.x.size, first.v.size):
+                raise ValueError("please make sure all the ESNs of the ensemble have the same number of nodes")
+            if (esn.f, esn.mode, esn.feedback, esn.input_norm, esn.dtype) != (first.f, first.mode, first.feedback, first.input_norm, first.dtype):
+                raise ValueError("please make sure all the ESNs of the ensemble use the same update protocol")
+        self.mode = first.mode
+        self.feedback = first.feedback
+        self.input_norm = first.input_norm
+        self.func = first.func
+        self.dtype = first.dtype
+        self.W = numpy.stack([esn.W.toarray() if hasattr(esn.W, "toarray") else esn.W for esn in self.esns])
+        self.Wu = numpy.stack([esn.Wu for esn in self.esns])
+        self.Wv = numpy.stack([esn.Wv for esn in self.esns])
+        self.Wback = numpy.stack([esn.Wback for esn in self.esns])
+        self.x = numpy.stack([esn.x[:, 0] for esn in self.esns])
+        self.u = numpy.stack([esn.u[:, 0] for esn in self.esns])
+        self.v = numpy.stack([esn.v[:, 0] for esn in self.esns])
+        self.t = 0
+        self.R = None
+        self.QtD = None
+        self.outputs = None
+        return
+
+    @classmethod
+    def from_params(cls, params, amount: int, seed=None):
+        """
+        Create an ensemble of ESNs built from the same parametres.
+
+        params: tuple of the parametres for the ESNs (Default param examples can be found in Experiment.default_params).
+        amount: number of ESNs in the ensemble.
+        seed (default None): master seed from which the seed of every ESN is derived.
+        """
+        seeds = numpy.random.SeedSequence(seed).spawn(amount)
+        return cls([TinyESN.TinyESN(*params, seed=member_seed) for member_seed in seeds])
+
+    def __len__(self):
+        return len(self.esns)
+
+    def run(self, inputs, return_outputs=False):
+        """
+        Run every reservoir of the ensemble over the same input sequence.
+
+        inputs: array of shape (T, K), or anything that can be reshaped to it (such as a list of T inputs).
+        return_outputs (default False): whether to also return the (R, T, L) outputs of the ESNs.
+
+        returns the (R, T, N) states of the reservoirs after each timestep (and the outputs if asked).
+        The update protocols are the same as in TinyESN.run.
+        """
+        inputs = numpy.asarray(inputs, dtype=self.dtype).reshape((-1, self.u.shape[1]))
+        if self.input_norm:
+            inputs = numpy.tanh(inputs)
+        steps = inputs.shape[0]
+        states = numpy.empty((len(self), steps, self.x.shape[1]), dtype=numpy.result_type(self.W, self.Wu, self.x))
+        outputs = None
+        if return_outputs or self.feedback:
+            outputs = numpy.empty((len(self), steps, self.v.shape[1]), dtype=states.dtype)
+        if steps == 0:
+            return (states, outputs) if return_outputs else states
+        instantaneous = self.mode == "instantaneous"
+        feedback = self.feedback
+        W, Wu, Wv, Wback, func = self.W, self.Wu, self.Wv, self.Wback, self.func
+        x0 = self.x
+        x = x0
+        v = self.v
+        previous = _batched(Wu, self.u)
+        for t in range(steps):
+            current = numpy.matmul(Wu, inputs[t])
+            if instantaneous:
+                previous = current
+            pre = _batched(W, x) + previous
+            if feedback:
+                pre += _batched(Wback, v)
+                if instantaneous:
+                    x = func(pre)
+                    v = func(_batched(Wv, x))
+                else:
+                    v = func(_batched(Wv, x))
+                    x = func(pre)
+                outputs[:, t] = v
+            else:
+                x = func(pre)
+            states[:, t] = x
+            previous = current
+        if not feedback:
+            if outputs is not None:
+                if instantaneous:
+                    outputs[:] = func(numpy.matmul(states, Wv.transpose(0, 2, 1)))
+                else:
+                    outputs[:, 0] = func(_batched(Wv, x0))
+                    outputs[:, 1:] = func(numpy.matmul(states[:, :-1], Wv.transpose(0, 2, 1)))
+                v = outputs[:, -1]
+            elif instantaneous:
+                v = func(_batched(Wv, x))
+            else:
+                v = func(_batched(Wv, states[:, -2] if steps > 1 else x0))
+        self.x = x
+        self.u = numpy.broadcast_to(inputs[-1], self.u.shape).copy()
+        self.v = v
+        self.t += steps
+        return (states, outputs) if return_outputs else states
+
+    def train_pseudoinverse(self, training_set, ridge=0.0, record_outputs=False, washout=10):
+        """
+        Train the Output Weight matrices of every ESN on the same training set, with one batched solve.
+
+        training_set: Dataset of the training set (a dict of form {input: target output} also works).
+        ridge (default 0.0): Tikhonov regularisation factor. With 0 the readouts are the plain pseudo-inverse solutions.
+        record_outputs (default False): whether to keep the harvested states, so that self.outputs can hold the (R, T, L) outputs of the trained readouts.
+        washout (default 10): number of initial timesteps left out of the training.
+
+        The trained readouts are also copied to the ESNs the ensemble was built from.
+        """
+        if not isinstance(training_set, Dataset):
+            training_set = Dataset.from_dict(training_set)
+        if training_set.targets.shape[1] != self.v.shape[1]:
+            raise ValueError(f"please make sure your ESN outputs match your training set: {training_set.targets.shape[1]}, {self.v.shape[1]}")
+        inputs = numpy.asarray(training_set.inputs, dtype=self.dtype).reshape((-1, self.u.shape[1]))
+        targets = training_set.targets
+        size = self.x.shape[1]
+        self.R, self.QtD = readout.empty(size, self.v.shape[1], (len(self),))
+        harvested = None
+        if record_outputs:
+            harvested = numpy.empty((len(self), max(len(inputs) - washout, 0), size), dtype=self.dtype)
+        for start in range(0, len(inputs), self._training_block):
+            states = self.run(inputs[start:start + self._training_block])
+            skip = max(washout - start, 0)
+            if skip >= states.shape[1]:
+                continue
+            kept = states[:, skip:].astype(numpy.float64, copy=False)
+            self.R, self.QtD = readout.update(self.R, self.QtD, kept, targets[start + skip:start + states.shape[1]])
+            if harvested is not None:
+                harvested[:, start + skip - washout:start + states.shape[1] - washout] = kept
+        Wv = readout.solve(self.R, self.QtD, ridge)
+        self.Wv = Wv.transpose(0, 2, 1).astype(self.dtype)
+        for esn, weights in zip(self.esns, self.Wv):
+            esn.Wv = weights
+        if harvested is not None:
+            self.outputs = self.func(numpy.matmul(harvested, self.Wv.transpose(0, 2, 1)))
+        return
+
+    def test(self, testing_set):
+        """
+        Test every ESN of the ensemble.
+
+        testing_set: Dataset of testing values (a dict of form {input: target_output} also works).
+        """
+        if not isinstance(testing_set, Dataset):
+            testing_set = Dataset.from_dict(testing_set)
+        _, self.outputs = self.run(testing_set.inputs, return_outputs=True)
+        return
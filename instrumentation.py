@@ -0,0 +1,108 @@
+"""Opt-in timing counters and callback hooks for ESNs and experiments."""
+import contextlib
+import json
+import time
+
+_NO_PHASE = contextlib.nullcontext() #reused by every phase of an ESN that is not instrumented
+
+EVENTS = ["pre_step", "post_step", "post_train"]
+
+
+class Instrumentation():
+    """
+    Counters of where an ESN (or an Experiment) spends its time, and hooks called while it runs.
+
+    Phases count the number of calls and the wall time spent in each named part of the work (such as "scaling", "update" or "solve").
+    steps counts the timesteps simulated, and allocations and allocated_bytes the result and buffer arrays allocated by the ESN.
+
+    Hooks are functions registered for an event:
+    pre_step(esn, t, u) is called before every timestep with the (K,) input, post_step(esn, t, x) after it with the (N,) new state,
+    and post_train(esn) once the readout has been trained.
+    An ESN only pays for the instrumentation when one is attached, and only steps through run one timestep at a time when a step hook is registered.
+    """
+
+    def __init__(self):
+        """Initialise empty counters and hooks."""
+        self.hooks = {event: [] for event in EVENTS}
+        self.reset()
+        return
+
+    def reset(self):
+        """Clear the counters, keeping the hooks."""
+        self.phases = {}
+        self.steps = 0
+        self.allocations = 0
+        self.allocated_bytes = 0
+        return
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager adding the wall time of its body to the phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        """Add seconds (over calls calls) to the phase name."""
+        phase = self.phases.setdefault(name, {"calls": 0, "seconds": 0.0})
+        phase["calls"] += calls
+        phase["seconds"] += seconds
+        return
+
+    def count_allocation(self, *arrays):
+        """Count arrays newly allocated by the ESN. None is ignored."""
+        for array in arrays:
+            if array is not None:
+                self.allocations += 1
+                self.allocated_bytes += array.nbytes
+        return
+
+    def add_hook(self, event, hook):
+        """Register hook to be called on event ("pre_step", "post_step" or "post_train")."""
+        if event not in self.hooks:
+            raise ValueError(f"please set event to one of {', '.join(EVENTS)}")
+        self.hooks[event].append(hook)
+        return
+
+    def remove_hook(self, event, hook):
+        """Unregister a hook added with add_hook."""
+        self.hooks[event].remove(hook)
+        return
+
+    def has_step_hooks(self):
+        """Whether any pre_step or post_step hook is registered."""
+        return bool(self.hooks["pre_step"] or self.hooks["post_step"])
+
+    def emit(self, event, *args):
+        """Call every hook registered for event with args."""
+        for hook in self.hooks[event]:
+            hook(*args)
+        return
+
+    def as_dict(self):
+        """Get the counters as a dict of plain python values."""
+        return {"phases": {name: dict(phase) for name, phase in self.phases.items()},
+                "steps": self.steps,
+                "allocations": self.allocations,
+                "allocated_bytes": self.allocated_bytes}
+
+    def to_json(self, path=None):
+        """Get the counters as a JSON string, also writing it to path if one is given."""
+        text = json.dumps(self.as_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def merge(self, stats):
+        """Add the counters of another Instrumentation, or of a dict from as_dict (such as one sent back by a worker process)."""
+        if isinstance(stats, Instrumentation):
+            stats = stats.as_dict()
+        for name, phase in stats["phases"].items():
+            self.add_time(name, phase["seconds"], phase["calls"])
+        self.steps += stats["steps"]
+        self.allocations += stats["allocations"]
+        self.allocated_bytes += stats["allocated_bytes"]
+        return
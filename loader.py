@@ -0,0 +1,133 @@
+"""Load the series under datasets/, parsing each file only once into a cached .npy file."""
+import glob
+import hashlib
+import json
+import os
+import types
+import numpy
+
+
+def _code_digest(digest, code):
+    """Add the bytecode and constants of a code object (and of the code objects nested in it, such as comprehensions) to a digest."""
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _code_digest(digest, const)
+        else:
+            digest.update(repr(const).encode())
+    return
+
+
+def _parser_digest(parse):
+    """Get a digest identifying a parse function by its name and code, so that editing it (even a lambda) gives another cache file."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{getattr(parse, '__module__', '')}.{getattr(parse, '__qualname__', repr(parse))}".encode())
+    code = getattr(parse, "__code__", None)
+    if code is not None:
+        _code_digest(digest, code)
+    return digest.hexdigest()
+
+
+def _source_digest(path):
+    """Get a digest of the contents of a file."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, write):
+    """Write a file through write(f), to a temporary file first, so that concurrent workers never read a half-written one."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        write(f)
+    os.replace(temporary, path)
+    return
+
+
+def load_series(path, parse):
+    """
+    Load the values of a dataset file as a read-only memory-mapped array.
+
+    path: path of the text or csv file.
+    parse: function turning the lines of the file into a list of values.
+
+    The parsed values are saved to a .npy file in a .cache directory next to the file. Its name holds a digest of the code of parse and of the
+    contents of the file, so editing either (or restoring an older file) parses the file again. The size and modification time of the file are
+    recorded next to the cache, so that the contents are only hashed again when they change.
+    Every process loading the same file then maps the same pages.
+    """
+    source = os.stat(path)
+    directory = os.path.join(os.path.dirname(path), ".cache")
+    name = os.path.join(directory, f"{os.path.basename(path)}.{_parser_digest(parse)}")
+    record = {"size": source.st_size, "mtime_ns": source.st_mtime_ns}
+    digest = None
+    try:
+        with open(name + ".json") as f:
+            recorded = json.load(f)
+        if all(recorded[key] == value for key, value in record.items()):
+            digest = recorded["digest"]
+    except (OSError, ValueError, KeyError):
+        pass
+    known = digest is not None
+    if not known:
+        digest = _source_digest(path)
+    record["digest"] = digest
+    cache = f"{name}.{digest}.npy"
+    if not os.path.exists(cache):
+        with open(path, "r") as f:
+            values = numpy.asarray(parse(f.readlines()), dtype=float)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write_atomic(cache, lambda f: numpy.save(f, values))
+        except OSError:
+            return values
+        # caches of older contents of the file are not valid any more
+        for stale in glob.glob(glob.escape(name) + ".*.npy"):
+            if stale != cache:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+    if not known:
+        try:
+            _write_atomic(name + ".json", lambda f: f.write(json.dumps(record).encode()))
+        except OSError:
+            pass
+    return numpy.load(cache, mmap_mode="r")
+
+
+class Series():
+    """Normalised view of a series of values. Values are only read and normalised when a window of them is asked for."""
+
+    def __init__(self, values, normaliser):
+        """
+        Initialise the series.
+
+        values: array of the raw values (such as the memory-mapped array returned by load_series).
+        normaliser: number every value is divided by.
+        """
+        self.values = values
+        self.normaliser = normaliser
+        return
+
+    def __getstate__(self):
+        """Pickle memory-mapped values by their cache path, so that worker processes map the file again instead of receiving a copy."""
+        state = dict(self.__dict__)
+        if isinstance(self.values, numpy.memmap) and self.values.filename is not None:
+            state["values"] = self.values.filename
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state["values"], str):
+            state["values"] = numpy.load(state["values"], mmap_mode="r")
+        self.__dict__.update(state)
+        return
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]/self.normaliser
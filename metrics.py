@@ -0,0 +1,69 @@
+"""
+Error and memory metrics for ESN outputs.
+
+Every metric works on (T, L) arrays of T timesteps of L outputs, and on (R, T, L) arrays holding R runs at once,
+in which case one score per run is returned. (T,) arrays are treated as a single output.
+"""
+import numpy
+
+
+def _as_sequences(values):
+    """Turn a sequence of targets or outputs into an array of shape (..., T, L)."""
+    values = numpy.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, numpy.newaxis]
+    return values
+
+
+def _score(values):
+    """Return a single score as a float, and the scores of several runs as an array."""
+    return float(values) if numpy.ndim(values) == 0 else values
+
+
+def _pair(target_output_set, real_output_set):
+    """Check that the targets and outputs line up, and return them as arrays."""
+    target = _as_sequences(target_output_set)
+    output = _as_sequences(real_output_set)
+    if target.shape[-2] != output.shape[-2]:
+        raise ValueError(f"Found input variables with inconstitent numbers of samples [{target.shape[-2]}, {output.shape[-2]}]")
+    return target, output
+
+
+def nmse(target_output_set, real_output_set):
+    """Normalised mean squared error: the mean squared error over the variance of the targets."""
+    target, output = _pair(target_output_set, real_output_set)
+    error = ((target - output)**2).sum(axis=(-2, -1))
+    variance = ((target - target.mean(axis=-2, keepdims=True))**2).sum(axis=(-2, -1))
+    return _score(error/variance)
+
+
+def nrmse(target_output_set, real_output_set):
+    """Normalised root mean squared error: the square root of the NMSE."""
+    return _score(numpy.sqrt(nmse(target_output_set, real_output_set)))
+
+
+def mae(target_output_set, real_output_set):
+    """Mean absolute error."""
+    target, output = _pair(target_output_set, real_output_set)
+    return _score(abs(target - output).mean(axis=(-2, -1)))
+
+
+def memory_capacity(inputs, real_output_set):
+    """
+    Memory capacity, as defined by Jaeger (2001, "Short Term Memory in Echo State Networks").
+
+    inputs: (T,) input sequence, or (R, T) for R runs.
+    real_output_set: (T, D) outputs, where output k-1 is trained to recall the input of k timesteps before. (R, T, D) for R runs.
+
+    returns the sum over the delays k of the squared correlation between the input delayed by k and output k-1.
+    """
+    inputs = numpy.asarray(inputs, dtype=float)
+    inputs, output = _pair(inputs[..., numpy.newaxis], real_output_set)
+    inputs = inputs[..., 0]
+    capacity = numpy.zeros(output.shape[:-2])
+    for k in range(1, output.shape[-1] + 1):
+        delayed = inputs[..., :-k] - inputs[..., :-k].mean(axis=-1, keepdims=True)
+        recalled = output[..., k:, k-1] - output[..., k:, k-1].mean(axis=-1, keepdims=True)
+        covariance = (delayed*recalled).sum(axis=-1)
+        capacity += covariance**2/((delayed**2).sum(axis=-1)*(recalled**2).sum(axis=-1))
+    return _score(capacity)
@@ -0,0 +1,56 @@
+"""
+Measure how long the core modules take to import, and check that they do not pull in the optional plotting libraries.
+
+usage: python perf_imports.py [--repeat 5] [--budget 0.5]
+
+Every measurement runs in a fresh interpreter. Exits with status 1 if igraph, matplotlib or scipy get imported by the core,
+or if the median import time goes over the budget (in seconds).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CORE_MODULES = ["TinyESN", "Experiment", "ensemble", "metrics", "dataset"]
+OPTIONAL_MODULES = ["igraph", "matplotlib", "scipy"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {optional!r} if name in sys.modules]}}))
+"""
+
+
+def measure(repeat=5):
+    """Import the core modules in repeat fresh interpreters, and return their import times and the optional modules they loaded."""
+    probe = _PROBE.format(modules=", ".join(CORE_MODULES), optional=OPTIONAL_MODULES)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    loaded = set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", probe], cwd=directory, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        times.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return times, sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the core ESN modules.")
+    parser.add_argument("--repeat", type=int, default=5, help="number of fresh interpreters to measure")
+    parser.add_argument("--budget", type=float, default=0.5, help="largest acceptable median import time, in seconds")
+    args = parser.parse_args()
+    times, loaded = measure(args.repeat)
+    median = statistics.median(times)
+    print(json.dumps({"modules": CORE_MODULES, "median_seconds": median, "min_seconds": min(times), "optional_modules_loaded": loaded}, indent=2))
+    if loaded or median > args.budget:
+        sys.exit(1)
+    return
+
+
+if __name__ == "__main__":
+    main()
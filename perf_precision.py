@@ -0,0 +1,58 @@
+"""
+Compare the throughput and accuracy of float32 and float64 reservoirs.
+
+usage: python perf_precision.py [--sizes 100 500 2000] [--steps 2000] [--seed 0] [--output results.json]
+
+For every reservoir size, the same ESN (same seed, so the same weights up to rounding) is built in both precisions.
+Each one is timed running --steps random inputs, then trained and tested on NARMA10, and the test NRMSE is reported.
+"""
+import argparse
+import json
+import time
+import numpy
+import TinyESN
+from NARMA10 import Narma10
+from metrics import nrmse
+
+DTYPES = {"float32": numpy.float32, "float64": numpy.float64}
+
+
+def measure(size, dtype, steps, seed, washout=100):
+    """Time run() and get the NARMA10 test NRMSE of an N=size reservoir in the given dtype."""
+    esn = TinyESN.TinyESN(1, size, 1, topology="random", connectivity=min(1.0, 10/size), seed=seed, dtype=dtype)
+    inputs = numpy.random.default_rng(seed).random((steps, 1))
+    esn.run(inputs[:10])
+    start = time.perf_counter()
+    esn.run(inputs)
+    elapsed = time.perf_counter() - start
+    benchmark = Narma10()
+    benchmark.seed(seed)
+    data = benchmark.create_training_set(2*steps)
+    training, testing = data.split(steps)
+    esn.train_pseudoinverse(training, ridge=1e-8, washout=washout)
+    esn.test(testing)
+    error = nrmse(testing.targets[washout:], esn.outputs[washout:])
+    return {"N": size, "dtype": numpy.dtype(dtype).name, "steps_per_second": steps/elapsed, "nrmse": float(error)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare float32 and float64 reservoirs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 2000], help="reservoir sizes to measure")
+    parser.add_argument("--steps", type=int, default=2000, help="number of timesteps to run, train and test on")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the reservoirs and of the benchmark")
+    parser.add_argument("--output", default=None, help="path of a JSON file to write the results to")
+    args = parser.parse_args()
+    results = []
+    for size in args.sizes:
+        for name, dtype in DTYPES.items():
+            result = measure(size, dtype, args.steps, args.seed)
+            results.append(result)
+            print(f"N={size:<6} {name}: {result['steps_per_second']:10.0f} steps/s, NRMSE {result['nrmse']:.4f}")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return
+
+
+if __name__ == "__main__":
+    main()
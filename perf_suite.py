@@ -0,0 +1,171 @@
+"""
+Time the construction, simulation, training and testing of ESNs over a range of reservoir sizes.
+
+usage: python perf_suite.py [--sizes 10 100 1000] [--steps 1000] [--lengths 1000 10000] [--repeat 3] [--engines numpy numba] [--max-difference 1e-10] [--output results.json] [--baseline old.json --tolerance 1.5]
+
+Every case is timed --repeat times and the fastest run is kept. The peak memory traced by tracemalloc (which numpy reports its arrays to)
+is measured on a separate run, so that tracing does not slow down the timings.
+Engines other than numpy are checked against it on the timed inputs, and the run exits with status 1 if their states or outputs differ by more than --max-difference.
+With --baseline, exits with status 1 if any case is more than --tolerance times slower than in the baseline JSON file.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy
+import TinyESN
+from dataset import Dataset
+from engines import verify
+
+TOPOLOGIES = ["random", "ring", "lattice", "torus", "fully_connected"]
+MODES = [("discretised", False), ("instantaneous", False), ("discretised", True), ("instantaneous", True)]
+MEASUREMENTS = ["seconds", "peak_bytes", "steps_per_second", "max_difference"] #fields of a result that are measured rather than identify its case
+
+
+def _best_time(function, repeat):
+    """Run function repeat times and return the fastest wall time, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _peak_memory(function):
+    """Run function once and return the peak memory traced during the run, in bytes."""
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def _measure(case, function, repeat, **fields):
+    """Time function and get its peak memory. Returns a result record."""
+    seconds = _best_time(function, repeat)
+    return dict(case=case, seconds=seconds, peak_bytes=_peak_memory(function), **fields)
+
+
+def _grid_size(size):
+    """Lattice and torus reservoirs need a square number of nodes, so round size to the nearest square."""
+    return max(int(round(numpy.sqrt(size))), 2)**2
+
+
+def bench_init(sizes, repeat, seed=0):
+    """Time TinyESN.__init__ for every topology and size."""
+    results = []
+    for size in sizes:
+        for topology in TOPOLOGIES:
+            n = _grid_size(size) if topology in ["lattice", "torus"] else size
+            results.append(_measure("init", lambda: TinyESN.TinyESN(1, n, 1, topology=topology, seed=seed), repeat, topology=topology, N=n))
+    return results
+
+
+def bench_run(sizes, steps, repeat, seed=0, engines=("numpy",)):
+    """
+    Time run() over steps timesteps for every update mode, with and without feedback, and every engine.
+
+    The results of engines other than numpy also hold the largest difference of their states and outputs from the numpy engine (see engines.verify).
+    """
+    results = []
+    inputs = numpy.random.default_rng(seed).random((steps, 1))
+    for size in sizes:
+        for mode, feedback in MODES:
+            for engine in engines:
+                esn = TinyESN.TinyESN(1, size, 1, mode=mode, feedback=feedback, seed=seed, engine=engine)
+                esn.run(inputs[:1]) #compiles the kernel of compiled engines
+                result = _measure("run", lambda: esn.run(inputs), repeat, mode=mode, feedback=feedback, engine=engine, N=size, steps=steps)
+                result["steps_per_second"] = steps/result["seconds"]
+                if engine != "numpy":
+                    result["max_difference"] = verify(esn, engine, inputs)
+                results.append(result)
+    return results
+
+
+def bench_train(sizes, lengths, repeat, seed=0):
+    """Time train_pseudoinverse against the length of the training sequence."""
+    results = []
+    rng = numpy.random.default_rng(seed)
+    for size in sizes:
+        esn = TinyESN.TinyESN(1, size, 1, seed=seed)
+        for length in lengths:
+            data = Dataset(rng.random(length), rng.random(length))
+            results.append(_measure("train", lambda: esn.train_pseudoinverse(data, ridge=1e-8), repeat, N=size, steps=length))
+    return results
+
+
+def bench_test(sizes, steps, repeat, seed=0):
+    """Time test() on a sequence of steps timesteps, and the latency of a single predict_step."""
+    results = []
+    rng = numpy.random.default_rng(seed)
+    data = Dataset(rng.random(steps), rng.random(steps))
+    for size in sizes:
+        esn = TinyESN.TinyESN(1, size, 1, seed=seed)
+        esn.train_pseudoinverse(data, ridge=1e-8, record_outputs=False)
+        results.append(_measure("test", lambda: esn.test(data), repeat, N=size, steps=steps))
+        esn.predict_step(data.inputs[0])
+        result = _measure("predict_step", lambda: esn.predict_step(data.inputs[0]), max(repeat, 100), N=size)
+        results.append(result)
+    return results
+
+
+def _key(result):
+    """Identify a result by everything except its measurements."""
+    return tuple(sorted((name, value) for name, value in result.items() if name not in MEASUREMENTS))
+
+
+def regressions(results, baseline, tolerance):
+    """Get the results that are more than tolerance times slower than the matching baseline result."""
+    previous = {_key(result): result["seconds"] for result in baseline}
+    return [dict(result, baseline_seconds=previous[_key(result)]) for result in results
+            if _key(result) in previous and result["seconds"] > tolerance*previous[_key(result)]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the construction, simulation, training and testing of ESNs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="reservoir sizes to sweep")
+    parser.add_argument("--steps", type=int, default=1000, help="number of timesteps for run and test")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1000, 10000], help="training sequence lengths")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each case, the fastest is kept")
+    parser.add_argument("--engines", nargs="+", default=["numpy"], help="engines to time run() with (see engines.py)")
+    parser.add_argument("--max-difference", type=float, default=1e-10, help="largest difference from the numpy engine accepted for the other engines")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the reservoirs and inputs")
+    parser.add_argument("--output", default=None, help="path of a JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="path of a JSON file of previous results to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="slowdown over the baseline counted as a regression")
+    args = parser.parse_args()
+    results = bench_init(args.sizes, args.repeat, args.seed)
+    results += bench_run(args.sizes, args.steps, args.repeat, args.seed, args.engines)
+    results += bench_train(args.sizes, args.lengths, args.repeat, args.seed)
+    results += bench_test(args.sizes, args.steps, args.repeat, args.seed)
+    for result in results:
+        details = " ".join(f"{name}={value}" for name, value in result.items() if name != "case" and name not in MEASUREMENTS)
+        difference = f" {result['max_difference']:10.2e} max difference" if "max_difference" in result else ""
+        print(f"{result['case']:<13}{details:<50}{result['seconds']*1e3:12.3f} ms {result['peak_bytes']/2**20:10.2f} MiB{difference}")
+    report = {"python": sys.version.split()[0], "numpy": numpy.__version__, "machine": platform.machine(), "results": results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    failed = False
+    for result in results:
+        if result.get("max_difference", 0.0) > args.max_difference:
+            print(f"mismatch: {result['engine']} engine differs from numpy by {result['max_difference']:.3e} (mode={result['mode']} feedback={result['feedback']} N={result['N']})", file=sys.stderr)
+            failed = True
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f)["results"], args.tolerance)
+        for result in slower:
+            print(f"regression: {result['case']} {result['seconds']:.6f}s against {result['baseline_seconds']:.6f}s", file=sys.stderr)
+        failed = failed or bool(slower)
+    if failed:
+        sys.exit(1)
+    return
+
+
+if __name__ == "__main__":
+    main()
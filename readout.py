@@ -0,0 +1,47 @@
+"""
+Fit linear readouts by least squares over long sequences of states, accumulated a block of timesteps at a time.
+
+Rather than X^T X, which squares the condition number of the states, the R factor of the QR decomposition of the states X seen so far is kept,
+along with Q^T D for the targets D. Both take O(N^2) memory, and the readout solved from them is the pseudo-inverse solution of X itself.
+Every function also works on stacks of them (leading dimensions), such as the readouts of an ensemble.
+"""
+import numpy
+
+
+def empty(size, outputs, stack=()):
+    """Get the R factor and Q^T D of no states yet, for size nodes and outputs outputs."""
+    return numpy.zeros(tuple(stack) + (0, size)), numpy.zeros(tuple(stack) + (0, outputs))
+
+
+def update(R, QtD, states, targets):
+    """
+    Fold a block of states and their targets into R and Q^T D.
+
+    R, QtD: R factor and Q^T D of the states seen so far, as returned by empty or update.
+    states: (T, N) block of states.
+    targets: (T, L) target outputs of the states.
+
+    returns the new R and Q^T D, with at most N rows.
+    """
+    size = R.shape[-1]
+    states = numpy.asarray(states, dtype=numpy.float64)
+    targets = numpy.broadcast_to(numpy.asarray(targets, dtype=numpy.float64), states.shape[:-1] + QtD.shape[-1:])
+    # the R factor of [X | D] is [[R, Q^T D], [0, S]], so the rows past the first N (S, the residual) are not needed
+    stacked = numpy.concatenate([numpy.concatenate([R, QtD], axis=-1), numpy.concatenate([states, targets], axis=-1)], axis=-2)
+    factor = numpy.linalg.qr(stacked, mode="r")[..., :size, :]
+    return factor[..., :size], factor[..., size:]
+
+
+def solve(R, QtD, ridge=0.0):
+    """
+    Solve for the (N, L) readout W minimising |X W - D|^2 + ridge |W|^2.
+
+    ridge (default 0.0): Tikhonov regularisation factor. With 0 the readout is the pseudo-inverse solution pinv(X) D, as pinv(X) = pinv(R) Q^T.
+    """
+    size = R.shape[-1]
+    if ridge > 0:
+        # ridge regression is the least squares fit of the states stacked over sqrt(ridge) I, whose R factor is invertible
+        penalty = numpy.broadcast_to(numpy.sqrt(ridge)*numpy.eye(size), R.shape[:-2] + (size, size))
+        R, QtD = update(R, QtD, penalty, numpy.zeros(penalty.shape[:-1] + QtD.shape[-1:]))
+        return numpy.linalg.solve(R, QtD)
+    return numpy.matmul(numpy.linalg.pinv(R), QtD)
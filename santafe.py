@@ -1,5 +1,6 @@
 from benchmark import *
-import numpy
+from dataset import Dataset
+from loader import load_series, Series
 """
 Take the santa fe laser time series dataset and turn it into a benchmark.
 
@@ -8,18 +9,12 @@ available at: https://github.com/MaterialMan/CHARC/blob/master/Support%20files/o
 """
 class SantaFe(BenchMark):
     def __init__(self):
-        f = open("datasets/santa-fe-laser.txt", "r")
-        lines = f.readlines()
-        data_un = [int(line) for line in lines[1:]]
-        normaliser = max(data_un)*2
-        self.data = [element/normaliser for element in data_un]
+        data_un = load_series("datasets/santa-fe-laser.txt", lambda lines: [int(line) for line in lines[1:]])
+        self.data = Series(data_un, data_un.max()*2)
         return
 
     def create_training_set(self, size):
-        training_set = {}
-        for i in range(len(self.data)-1):
-            training_set[(self.data[i])] = numpy.array([self.data[i+1]])
-        return training_set
+        return Dataset(self.data[:-1], self.data[1:])
 
     def reset(self):
         return
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""Search the parametres of ESNs on a benchmark, on a process pool, stopping bad configurations early."""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import itertools
+import json
+import math
+import os
+import numpy
+import TinyESN
+import metrics
+from benchmark import BenchMark
+
+READOUT_PARAMS = {"ridge": 0.0, "washout": 10} #parametres of the readout only, with their defaults. Trials differing only in these share a reservoir
+_ALIASES = {"function": "f"} #names used by Experiment.default_params for TinyESN arguments
+
+
+def grid(space):
+    """
+    Get every combination of the values of a parametre space.
+
+    space: dict of form {name: list of values}, where names are TinyESN arguments (or keys of Experiment.default_params), "ridge" or "washout".
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def sample(space, amount: int, seed=None):
+    """
+    Draw random trials from a parametre space.
+
+    space: dict of form {name: values}. A list of values is sampled from uniformly, a (low, high) tuple gives a uniform range (of integers if both bounds are ints).
+    amount: number of trials to draw.
+    seed (default None): seed of the draw.
+    """
+    rng = numpy.random.default_rng(seed)
+    trials = []
+    for _ in range(amount):
+        trial = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    trial[name] = int(rng.integers(low, high + 1))
+                else:
+                    trial[name] = float(rng.uniform(low, high))
+            else:
+                trial[name] = values[rng.integers(len(values))]
+        trials.append(trial)
+    return trials
+
+
+def _split_trial(trial):
+    """Split a trial into the TinyESN arguments of its reservoir and the parametres of its readout."""
+    params = {_ALIASES.get(name, name): value for name, value in trial.items() if name not in READOUT_PARAMS}
+    readout = {name: trial.get(name, default) for name, default in READOUT_PARAMS.items()}
+    return params, readout
+
+
+def _reservoir_key(params):
+    """Identify the reservoir built from TinyESN arguments."""
+    return tuple(sorted(params.items(), key=lambda item: item[0]))
+
+
+def _score(record):
+    """Get the testing NRMSE of a record, counting failed (nan) fits as the worst."""
+    score = record["testing_nrmse"]
+    return math.inf if math.isnan(score) else score
+
+
+def _describe(value):
+    """Get a JSON-friendly description of a parametre value (functions are described by name)."""
+    return getattr(value, "__name__", value) if callable(value) else value
+
+
+def _described(trial):
+    """Get the parametres of a trial as they are stored in (and read back from) the results file."""
+    return json.loads(json.dumps({name: _describe(value) for name, value in trial.items()}))
+
+
+def _test_outputs(esn, states, x0):
+    """Get the outputs of the trained readout of esn over (T, N) states harvested without feedback, starting from the (N, 1) state x0, as test does."""
+    outputs = numpy.dot(states, esn.Wv.T)
+    if esn.mode == "discretised":
+        outputs = numpy.concatenate([numpy.dot(esn.Wv, x0).T, outputs[:-1]])
+    return esn.func(outputs)
+
+
+def _evaluate(params, readouts, data, split, seed):
+    """
+    Build one reservoir, harvest its states once, and fit and score every readout in readouts. Runs in the worker processes of Search.
+
+    returns the (training NRMSE, testing NRMSE) of every readout.
+    """
+    esn = TinyESN.TinyESN(**params, seed=seed)
+    training_set, testing_set = data.split(split)
+    states = esn.run(training_set.inputs)
+    x, u, v = esn.x, esn.u, esn.v
+    # without feedback the testing states do not depend on the readout, so they are harvested once too
+    testing_states = None if esn.feedback else esn.run(testing_set.inputs)
+    results = []
+    for readout in readouts:
+        washout = readout["washout"]
+        esn.reset_readout()
+        esn.accumulate_readout(states[washout:], training_set.targets[washout:])
+        esn.solve_readout(readout["ridge"])
+        training_nrmse = metrics.nrmse(training_set.targets[washout:], esn.func(numpy.dot(states[washout:], esn.Wv.T)))
+        if testing_states is None:
+            esn.x, esn.u, esn.v = x, u, v
+            esn.test(testing_set)
+            outputs = esn.outputs
+        else:
+            outputs = _test_outputs(esn, testing_states, x)
+        results.append((training_nrmse, metrics.nrmse(testing_set.targets, outputs)))
+    return results
+
+
+class Search():
+    """
+    Search for the best parametres of an ESN on a benchmark, with successive halving [1].
+
+    Every trial is first trained and tested on short sequences. Only the best 1/eta of them move on to the next rung, where the sequences are eta times longer.
+    Each reservoir is harvested once per rung, and all the readouts that share it (trials that only differ in ridge or washout) are fitted on the same states.
+    Results are appended to a JSON lines file as soon as they arrive, so that a search interrupted half way resumes from where it stopped.
+    """
+
+    def __init__(self, benchmark: BenchMark, trials, path=None, processes=None, seed=None, length=250, rungs=3, eta=2, max_pending=None):
+        """
+        Initialise the search.
+
+        benchmark: benchmark to train and test on, such as Narma10().
+        trials: list of dicts of parametres, as made by grid or sample.
+        path (default None): JSON lines file the results are written to. If it already holds results of this search (same seed), the ones of trials whose parametres are unchanged are reused.
+        processes (default None): number of worker processes. None uses every core, 1 runs everything in this process.
+        seed (default None): master seed of the reservoirs and benchmark sequences. Resuming a search needs the same seed, which is also saved with every result.
+        length (default 250): length of the training (and testing) sequences of the first rung.
+        rungs (default 3): number of rungs of successive halving. With 1, every trial is only run once.
+        eta (default 2): factor by which the number of trials shrinks, and the sequence length grows, at every rung.
+        max_pending (default None): largest number of reservoirs being evaluated or waiting at once, which bounds the memory used. Defaults to twice the number of processes.
+        """
+        self.benchmark = benchmark
+        self.trials = list(trials)
+        self.path = path
+        self.processes = processes or os.cpu_count() or 1
+        self.length = length
+        self.rungs = rungs
+        self.eta = eta
+        self.max_pending = max_pending or 2*self.processes
+        self.results = {} #(trial index, rung): record
+        self._reservoirs = {} #reservoir key: index of the first trial using it, which seeds the reservoir
+        for index, trial in enumerate(self.trials):
+            self._reservoirs.setdefault(_reservoir_key(_split_trial(trial)[0]), index)
+        if path is not None and os.path.exists(path):
+            line = ""
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue #blank line, or the last line of a search that was killed while writing it
+                    seed = record["seed"] if seed is None else seed
+                    if record["seed"] == seed and self._matches(record):
+                        self.results[record["trial"], record["rung"]] = record
+            if line and not line.endswith("\n"):
+                with open(path, "a") as f:
+                    f.write("\n")
+        self.seed = numpy.random.SeedSequence(seed).entropy if seed is None else seed
+        return
+
+    def _matches(self, record):
+        """
+        Whether a record read back from the results file was made by the trial it names, with the same reservoir.
+
+        Records of a file written by a search whose trials were since edited or reordered are left out (and their trials run again), rather than
+        attached to the wrong parametres.
+        """
+        index = record["trial"]
+        if not 0 <= index < len(self.trials) or record["params"] != _described(self.trials[index]):
+            return False
+        return record.get("reservoir") == self._reservoir(index)
+
+    def _reservoir(self, index):
+        """Get the index of the trial seeding the reservoir of trial index."""
+        return self._reservoirs[_reservoir_key(_split_trial(self.trials[index])[0])]
+
+    def _jobs(self, indices, rung):
+        """Group the trials at indices by reservoir, leaving out those already done at this rung. Returns (reservoir index, params, [(trial index, readout)])."""
+        reservoirs = {}
+        for index in indices:
+            if (index, rung) in self.results:
+                continue
+            params, readout = _split_trial(self.trials[index])
+            key = _reservoir_key(params)
+            reservoirs.setdefault(key, (self._reservoirs[key], params, []))[2].append((index, readout))
+        return reservoirs.values()
+
+    def _record(self, index, rung, length, scores):
+        """Store the scores of a trial, and append them to the results file."""
+        record = {"trial": index,
+                  "rung": rung,
+                  "length": length,
+                  "seed": self.seed,
+                  "reservoir": self._reservoir(index),
+                  "params": {name: _describe(value) for name, value in self.trials[index].items()},
+                  "training_nrmse": scores[0],
+                  "testing_nrmse": scores[1]}
+        self.results[index, rung] = record
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return
+
+    def _data(self, rung, length):
+        """Create the training and testing sequences of a rung."""
+        self.benchmark.seed(numpy.random.SeedSequence(self.seed, spawn_key=(1, rung)))
+        self.benchmark.reset()
+        return self.benchmark.create_training_set(2*length)
+
+    def _run_rung(self, indices, rung, executor):
+        """Evaluate the trials at indices on the sequences of a rung."""
+        length = self.length*self.eta**rung
+        jobs = list(self._jobs(indices, rung))
+        if not jobs:
+            return
+        data = self._data(rung, length)
+        pending = {}
+        for reservoir, params, readouts in jobs:
+            arguments = (params, [readout for _, readout in readouts], data, length, numpy.random.SeedSequence(self.seed, spawn_key=(0, reservoir)))
+            if executor is None:
+                for (index, _), scores in zip(readouts, _evaluate(*arguments)):
+                    self._record(index, rung, length, scores)
+                continue
+            if len(pending) >= self.max_pending:
+                self._collect(pending, rung, length, FIRST_COMPLETED)
+            pending[executor.submit(_evaluate, *arguments)] = readouts
+        while pending:
+            self._collect(pending, rung, length, FIRST_COMPLETED)
+        return
+
+    def _collect(self, pending, rung, length, return_when):
+        """Wait for submitted reservoirs to be evaluated and record their scores."""
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            readouts = pending.pop(future)
+            for (index, _), scores in zip(readouts, future.result()):
+                self._record(index, rung, length, scores)
+        return
+
+    def run(self):
+        """
+        Run the search.
+
+        returns the records of the trials that reached the last rung, best (lowest testing NRMSE) first.
+        """
+        indices = list(range(len(self.trials)))
+        executor = None if self.processes == 1 else ProcessPoolExecutor(max_workers=self.processes)
+        try:
+            for rung in range(self.rungs):
+                self._run_rung(indices, rung, executor)
+                indices.sort(key=lambda index: _score(self.results[index, rung]))
+                if rung < self.rungs - 1:
+                    indices = indices[:max(1, math.ceil(len(indices)/self.eta))]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return [self.results[index, self.rungs - 1] for index in indices]
+
+    def best(self):
+        """Get the parametres of the best trial found by run."""
+        return self.trials[min((record for (_, rung), record in self.results.items() if rung == self.rungs - 1), key=_score)["trial"]]
+
+
+"""
+Bibliography:
+
+[1] Jamieson, Kevin, and Ameet Talwalkar. 2016. “Non-Stochastic Best Arm Identification and Hyperparameter Optimization.” In Proceedings of the 19th International Conference on Artificial Intelligence and Statistics, 240–48.
+"""
@@ -0,0 +1,382 @@
+"""
+Serve one trained ESN to many independent streams, advancing all of them together.
+
+usage: python server.py [--N 100] [--sessions 200] [--steps 100] [--window 0.001] [--socket PATH]
+
+Run from the command line, it load-tests a server: every session is a client sending steps inputs one after the other, and the throughput and
+latencies are printed as JSON. With --socket the clients connect through a local (unix) socket, otherwise they call the server in-process.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import tempfile
+import time
+import numpy
+import TinyESN
+
+_ERRORS = {error.__name__: error for error in (KeyError, ValueError, TypeError)} #exceptions the server sends back by name, raised again by Client
+
+
+class SessionPool():
+    """
+    Reservoir states of many sessions of one ESN, held as the columns of (N, S), (K, S) and (L, S) arrays.
+
+    Every session is an independent stream, as if it had its own copy of the ESN, but all the weights are shared,
+    and any set of sessions is advanced by one timestep with a single matrix product.
+    """
+
+    def __init__(self, esn, capacity=64, idle_timeout=300.0):
+        """
+        Initialise the pool.
+
+        esn: trained TinyESN to serve. New sessions start from its current state.
+        capacity (default 64): number of sessions the arrays are first allocated for. They double in size when they are full.
+        idle_timeout (default 300.0): number of seconds after which evict_idle removes a session that has not been stepped.
+        """
+        self.esn = esn
+        self.idle_timeout = idle_timeout
+        self.x = numpy.empty((esn.x.size, 0), dtype=esn.x.dtype)
+        self.u = numpy.empty((esn.u.size, 0), dtype=esn.x.dtype)
+        self.v = numpy.empty((esn.v.size, 0), dtype=esn.x.dtype)
+        self.free = []
+        self.columns = {} #session: column of its state
+        self.last_seen = {} #session: time.monotonic() of its last step
+        self._ids = itertools.count()
+        self._grow(capacity)
+        return
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __contains__(self, session):
+        return session in self.columns
+
+    def _grow(self, capacity):
+        """Reallocate the state arrays for capacity sessions."""
+        size = self.x.shape[1]
+        for name in ["x", "u", "v"]:
+            old = getattr(self, name)
+            new = numpy.empty((old.shape[0], capacity), dtype=old.dtype)
+            new[:, :size] = old
+            setattr(self, name, new)
+        self.free.extend(range(capacity - 1, size - 1, -1))
+        return
+
+    def create(self):
+        """Open a new session, starting from the current state of the ESN, and return its id."""
+        if not self.free:
+            self._grow(2*self.x.shape[1])
+        session = next(self._ids)
+        column = self.free.pop()
+        self.x[:, column] = self.esn.x[:, 0]
+        self.u[:, column] = self.esn.u[:, 0]
+        self.v[:, column] = self.esn.v[:, 0]
+        self.columns[session] = column
+        self.last_seen[session] = time.monotonic()
+        return session
+
+    def evict(self, session):
+        """Close a session, freeing its column."""
+        self.free.append(self.columns.pop(session))
+        del self.last_seen[session]
+        return
+
+    def evict_idle(self, now=None):
+        """Close every session that has not been stepped for idle_timeout seconds, and return their ids."""
+        now = time.monotonic() if now is None else now
+        idle = [session for session, seen in self.last_seen.items() if now - seen > self.idle_timeout]
+        for session in idle:
+            self.evict(session)
+        return idle
+
+    def step(self, sessions, inputs):
+        """
+        Advance sessions by one timestep, as predict_step would for each of them.
+
+        sessions: list of B different session ids.
+        inputs: (B, K) inputs of the sessions, or anything that can be reshaped to it.
+
+        returns the (B, L) outputs of the sessions.
+        """
+        columns = numpy.fromiter((self.columns[session] for session in sessions), dtype=numpy.intp, count=len(sessions))
+        inputs = numpy.asarray(inputs, dtype=self.x.dtype).reshape((len(sessions), self.u.shape[0])).T
+        if self.esn.input_norm:
+            inputs = numpy.tanh(inputs)
+        x, u, v = self.esn._step_columns(self.x[:, columns], self.u[:, columns], self.v[:, columns], inputs)
+        self.x[:, columns] = x
+        self.u[:, columns] = u
+        self.v[:, columns] = v
+        now = time.monotonic()
+        for session in sessions:
+            self.last_seen[session] = now
+        return v.T
+
+
+class Server():
+    """
+    Asyncio front end of a SessionPool, batching the steps requested at about the same time.
+
+    Step requests are queued, and once the first one arrives the server waits window seconds for more before advancing every session with a
+    pending input in one SessionPool.step. A session with several pending inputs gets one per batch, in order.
+    """
+
+    def __init__(self, pool: SessionPool, window=0.001, max_batch=None):
+        """
+        Initialise the server.
+
+        pool: SessionPool holding the sessions.
+        window (default 0.001): number of seconds requests are gathered for before a batch is run.
+        max_batch (default None): largest number of sessions advanced in one batch. None has no limit.
+        """
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.steps = 0
+        self._queue = collections.deque()
+        self._wakeup = None
+        self._tasks = []
+        self._servers = []
+        return
+
+    async def start(self):
+        """Start the batching and idle eviction tasks. Must be called from the event loop the server runs in."""
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._batcher()), asyncio.ensure_future(self._reaper())]
+        return
+
+    async def stop(self):
+        """Stop the tasks and close the sockets of the server."""
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._servers = []
+        self._tasks = []
+        return
+
+    def create(self):
+        """Open a new session and return its id."""
+        return self.pool.create()
+
+    def evict(self, session):
+        """Close a session."""
+        self.pool.evict(session)
+        return
+
+    async def step(self, session, u):
+        """Queue an input for a session and wait for its (L,) output."""
+        if session not in self.pool:
+            raise KeyError(f"no session {session}")
+        # checked here rather than in the batch, so that a malformed input only fails its own request and not the whole batch
+        u = numpy.asarray(u, dtype=self.pool.x.dtype).ravel()
+        if u.size != self.pool.u.shape[0]:
+            raise ValueError(f"please give {self.pool.u.shape[0]} input values per step, got {u.size}")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((session, u, future))
+        self._wakeup.set()
+        return await future
+
+    async def _batcher(self):
+        """Run the queued steps in batches, for as long as the server runs."""
+        while True:
+            await self._wakeup.wait()
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            batch = {}
+            waiting = collections.deque()
+            while self._queue:
+                request = self._queue.popleft()
+                if request[0] in batch or (self.max_batch is not None and len(batch) >= self.max_batch):
+                    waiting.append(request)
+                elif request[0] not in self.pool:
+                    request[2].set_exception(KeyError(f"no session {request[0]}"))
+                else:
+                    batch[request[0]] = request
+            self._queue = waiting
+            if waiting:
+                self._wakeup.set()
+            if not batch:
+                continue
+            requests = list(batch.values())
+            try:
+                outputs = self.pool.step([request[0] for request in requests], [request[1] for request in requests])
+            except Exception as error:
+                for request in requests:
+                    if not request[2].done():
+                        request[2].set_exception(error)
+                continue
+            self.batches += 1
+            self.steps += len(requests)
+            for request, output in zip(requests, outputs):
+                if not request[2].done():
+                    request[2].set_result(output)
+
+    async def _reaper(self):
+        """Evict idle sessions, for as long as the server runs."""
+        while True:
+            await asyncio.sleep(max(self.pool.idle_timeout/4, 0.01))
+            self.pool.evict_idle()
+
+    async def serve_unix(self, path):
+        """Listen on a local (unix) socket at path, for Client connections."""
+        self._servers.append(await asyncio.start_unix_server(self._handle, path=path))
+        return
+
+    async def serve_tcp(self, host="127.0.0.1", port=0):
+        """Listen on a TCP port, for Client connections. Returns the port, which is picked by the system if port is 0."""
+        server = await asyncio.start_server(self._handle, host=host, port=port)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        """
+        Answer the requests of one connection: one JSON object per line, of form {"op": "create"}, {"op": "step", "session": id, "input": [...]} or {"op": "evict", "session": id}.
+
+        A request that fails is answered with {"error": message, "type": name of the exception}, such as "KeyError" for an unknown session or "ValueError" for a malformed input.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("please send one JSON object per request")
+                    if request["op"] == "create":
+                        response = {"session": self.create()}
+                    elif request["op"] == "step":
+                        response = {"output": (await self.step(request["session"], request["input"])).tolist()}
+                    elif request["op"] == "evict":
+                        self.evict(request["session"])
+                        response = {}
+                    else:
+                        raise ValueError(f"unknown op {request['op']}")
+                except (KeyError, ValueError, TypeError) as error:
+                    response = {"error": str(error.args[0]) if len(error.args) == 1 else str(error), "type": type(error).__name__}
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+class Client():
+    """Client of a Server listening on a local socket. Requests of one client are answered one at a time, so use one client per stream."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        return
+
+    @classmethod
+    async def connect(cls, path=None, host="127.0.0.1", port=None):
+        """Connect to the unix socket at path, or else to the TCP port of host."""
+        if path is not None:
+            return cls(*await asyncio.open_unix_connection(path))
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def _request(self, request):
+        """Send a request and wait for its response."""
+        self.writer.write((json.dumps(request) + "\n").encode())
+        await self.writer.drain()
+        response = json.loads(await self.reader.readline())
+        if "error" in response:
+            raise _ERRORS.get(response.get("type"), KeyError)(response["error"])
+        return response
+
+    async def create(self):
+        """Open a new session and return its id."""
+        return (await self._request({"op": "create"}))["session"]
+
+    async def step(self, session, u):
+        """Feed an input to a session and get its (L,) output."""
+        return numpy.array((await self._request({"op": "step", "session": session, "input": numpy.ravel(u).tolist()}))["output"])
+
+    async def evict(self, session):
+        """Close a session."""
+        await self._request({"op": "evict", "session": session})
+        return
+
+    async def close(self):
+        """Close the connection."""
+        self.writer.close()
+        await self.writer.wait_closed()
+        return
+
+
+async def load_test(server: Server, sessions=100, steps=100, path=None, seed=0):
+    """
+    Open sessions streams that each send steps random inputs one after the other, and measure how fast they are answered.
+
+    server: started Server to test.
+    path (default None): unix socket the server listens on. None calls the server in-process.
+
+    returns the number of steps answered per second and the latency percentiles, in seconds.
+    """
+    rng = numpy.random.default_rng(seed)
+    inputs = rng.random((sessions, steps, server.pool.u.shape[0]))
+    latencies = []
+
+    async def stream(index):
+        client = None if path is None else await Client.connect(path)
+        target = server if client is None else client
+        session = await target.create() if client is not None else target.create()
+        for u in inputs[index]:
+            start = time.perf_counter()
+            await target.step(session, u)
+            latencies.append(time.perf_counter() - start)
+        if client is None:
+            server.evict(session)
+        else:
+            await client.evict(session)
+            await client.close()
+        return
+
+    batches = server.batches
+    start = time.perf_counter()
+    await asyncio.gather(*(stream(index) for index in range(sessions)))
+    elapsed = time.perf_counter() - start
+    latencies = numpy.array(latencies)
+    return {"sessions": sessions,
+            "steps_per_second": len(latencies)/elapsed,
+            "mean_batch": len(latencies)/max(server.batches - batches, 1),
+            "latency_p50": float(numpy.percentile(latencies, 50)),
+            "latency_p99": float(numpy.percentile(latencies, 99))}
+
+
+async def _main(args):
+    """Build an ESN, serve it and load-test it."""
+    esn = TinyESN.TinyESN(1, args.N, 1, seed=0)
+    server = Server(SessionPool(esn), window=args.window)
+    await server.start()
+    try:
+        path = None
+        if args.socket:
+            path = os.path.join(tempfile.mkdtemp(), "esn.sock")
+            await server.serve_unix(path)
+        print(json.dumps(await load_test(server, args.sessions, args.steps, path), indent=2))
+    finally:
+        await server.stop()
+    return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a multi-session ESN server.")
+    parser.add_argument("--N", type=int, default=100, help="number of reservoir nodes")
+    parser.add_argument("--sessions", type=int, default=200, help="number of concurrent streams")
+    parser.add_argument("--steps", type=int, default=100, help="number of inputs sent by every stream")
+    parser.add_argument("--window", type=float, default=0.001, help="batching window, in seconds")
+    parser.add_argument("--socket", action="store_true", help="connect the streams through a local socket rather than in-process")
+    asyncio.run(_main(parser.parse_args()))
+    return
+
+
+if __name__ == "__main__":
+    main()
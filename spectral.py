@@ -0,0 +1,91 @@
+"""Estimate the spectral radius and largest singular value of reservoir weight matrices."""
+import numpy
+
+
+def _scipy_sparse_linalg():
+    """Import scipy.sparse.linalg on first use. Returns None if scipy is not installed."""
+    try:
+        import scipy.sparse.linalg
+    except ImportError:
+        return None
+    return scipy.sparse.linalg
+
+
+def _dense(W):
+    """Return W as a dense array."""
+    return W.toarray() if hasattr(W, "toarray") else numpy.asarray(W)
+
+
+def spectral_radius(W, method="dense", nonnegative=False, tol=1e-8, maxiter=1000):
+    """
+    Get the largest absolute eigenvalue of W.
+
+    W: square weight matrix, dense or scipy sparse.
+    method (default "dense"): "dense" computes every eigenvalue, "iterative" only the leading one (ARPACK if scipy is installed, power iteration otherwise).
+    ARPACK starts from a fixed vector rather than a random one, so that the same W always gives exactly the same value.
+    nonnegative (default False): whether every entry of W is nonnegative, which lets the power iteration converge to the Perron root.
+    """
+    if method == "dense":
+        return float(max(abs(numpy.linalg.eigvals(_dense(W)))))
+    linalg = _scipy_sparse_linalg()
+    if linalg is not None and W.shape[0] > 2:
+        return float(max(abs(linalg.eigs(W, k=1, which="LM", v0=numpy.ones(W.shape[0]), tol=tol, maxiter=maxiter, return_eigenvectors=False))))
+    if nonnegative:
+        return _perron_root(W, tol, maxiter)
+    return _growth_rate(W, maxiter)
+
+
+def largest_singular_value(W, method="dense", tol=1e-8, maxiter=1000):
+    """
+    Get the largest singular value of W.
+
+    W: weight matrix, dense or scipy sparse.
+    method (default "dense"): "dense" computes the full SVD, "iterative" only the leading singular value (ARPACK if scipy is installed, power iteration otherwise).
+    """
+    if method == "dense":
+        return float(numpy.linalg.norm(_dense(W), 2))
+    linalg = _scipy_sparse_linalg()
+    if linalg is not None and min(W.shape) > 1:
+        return float(max(linalg.svds(W, k=1, v0=numpy.ones(min(W.shape)), tol=tol, maxiter=maxiter, return_singular_vectors=False)))
+    x = numpy.ones(W.shape[1])/numpy.sqrt(W.shape[1])
+    value = 0.0
+    for _ in range(maxiter):
+        y = W.T @ (W @ x)
+        norm = numpy.linalg.norm(y)
+        if norm == 0:
+            return 0.0
+        x = y/norm
+        if abs(norm - value) <= tol*norm:
+            break
+        value = norm
+    return float(numpy.sqrt(norm))
+
+
+def _perron_root(W, tol, maxiter):
+    """Power iteration for the leading eigenvalue of a nonnegative matrix."""
+    # iterating on W + I keeps the same leading eigenvector but stops periodic matrices (such as a ring without self-connections) from oscillating
+    x = numpy.ones(W.shape[0])/numpy.sqrt(W.shape[0])
+    value = 0.0
+    for _ in range(maxiter):
+        y = W @ x + x
+        norm = numpy.linalg.norm(y)
+        x = y/norm
+        if abs(norm - value) <= tol*norm:
+            break
+        value = norm
+    return float(norm - 1)
+
+
+def _growth_rate(W, maxiter):
+    """Estimate the spectral radius of any square matrix from the average growth of W^k x."""
+    x = numpy.random.default_rng(0).standard_normal(W.shape[0])
+    x = x/numpy.linalg.norm(x)
+    logs = []
+    for _ in range(maxiter):
+        y = W @ x
+        norm = numpy.linalg.norm(y)
+        if norm == 0:
+            return 0.0
+        logs.append(numpy.log(norm))
+        x = y/norm
+    return float(numpy.exp(numpy.mean(logs[maxiter//2:])))
@@ -0,0 +1,183 @@
+"""Least recently used cache of the states harvested from reservoirs, so that the same reservoir driven by the same inputs is only simulated once."""
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import types
+import numpy
+from stencil import Stencil
+
+
+class StateCache():
+    """
+    Cache of the (T, N) states of reservoir runs, kept in memory up to a budget and optionally spilled to disk.
+
+    An entry is identified by a hash of everything the states depend on: the weights driving the reservoir, the update function, mode and feedback,
+    the dtype, the state the run started from and the (normalised) input sequence. Without feedback the readout is left out, so retraining Wv does
+    not invalidate the states. With feedback Wv drives the reservoir, so it is part of the key.
+    Since every run moves the state of the ESN on, a sequence is run again from the same state (and read from the cache) after TinyESN.reset_state or set_state.
+
+    Weights are expected to be replaced rather than modified in place, as every method of TinyESN does.
+    Cached arrays are made read-only, since they are handed out to every run that hits them.
+    """
+
+    def __init__(self, max_bytes=256*2**20, spill_dir=None):
+        """
+        Initialise the cache.
+
+        max_bytes (default 256 MiB): memory budget of the cached arrays. The least recently used entries are evicted to keep under it.
+        spill_dir (default None): directory evicted entries are written to, and read back (memory-mapped) from. None drops them.
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.entries = OrderedDict() #key: dict of arrays, least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def key(self, esn, inputs):
+        """Get the key of running esn, from its current state, over a (T, K) array of normalised inputs."""
+        digest = hashlib.blake2b(digest_size=20)
+        _function_digest(digest, esn.f)
+        digest.update(f"{esn.mode}|{esn.feedback}|{numpy.dtype(esn.x.dtype).name}|{inputs.shape}".encode())
+        if esn.sparse:
+            weights = [esn.W.data, esn.W.indices, esn.W.indptr]
+        elif isinstance(esn.W, Stencil):
+            weights = [numpy.array(esn.W.grid_shape), numpy.array(esn.W.offsets), esn.W.weights]
+        else:
+            weights = [esn.W]
+        weights += [esn.Wu, esn.x, esn.u]
+        if esn.feedback:
+            weights += [esn.Wback, esn.Wv, esn.v]
+        for array in weights + [inputs]:
+            digest.update(numpy.ascontiguousarray(array).data)
+        return digest.hexdigest()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries or (self.spill_dir is not None and os.path.isdir(self._spill_path(key)))
+
+    def get(self, key):
+        """Get the arrays cached under key (None if there are none), marking them as the most recently used."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.spill_dir is not None and os.path.isdir(self._spill_path(key)):
+            entry = self._read_spilled(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """
+        Cache a dict of arrays under key.
+
+        entry: dict of form {name: array or None}, such as {"states": ..., "x": ...}. The arrays are made read-only.
+        """
+        for array in entry.values():
+            if array is not None:
+                array.flags.writeable = False
+        size = _size(entry)
+        if key in self.entries:
+            self.nbytes -= _size(self.entries.pop(key))
+        if size > self.max_bytes:
+            self._spill(key, entry)
+            return
+        self.entries[key] = entry
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.nbytes -= _size(evicted)
+            self._spill(evicted_key, evicted)
+        return
+
+    def clear(self):
+        """Empty the cache, including its spill directory."""
+        self.entries.clear()
+        self.nbytes = 0
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            os.makedirs(self.spill_dir, exist_ok=True)
+        return
+
+    def stats(self):
+        """Get the number of hits, misses, entries and bytes held in memory."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.nbytes}
+
+    def _spill_path(self, key):
+        """Get the directory an entry is spilled to."""
+        return None if self.spill_dir is None else os.path.join(self.spill_dir, key)
+
+    def _spill(self, key, entry):
+        """Write an evicted entry to the spill directory, one .npy file per array, if there is one."""
+        path = self._spill_path(key)
+        if path is None or os.path.isdir(path):
+            return
+        # written to a temporary directory first, so that a half written entry is never read back
+        temporary = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(temporary, exist_ok=True)
+        for name, array in entry.items():
+            if array is not None:
+                numpy.save(os.path.join(temporary, name + ".npy"), array)
+        try:
+            os.replace(temporary, path)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+        return
+
+    def _read_spilled(self, key):
+        """Memory-map the arrays of a spilled entry, read-only. Returns None if it can not be read."""
+        path = self._spill_path(key)
+        try:
+            return {name[:-len(".npy")]: numpy.load(os.path.join(path, name), mmap_mode="r") for name in os.listdir(path)}
+        except (OSError, ValueError):
+            return None
+
+
+def _function_digest(digest, f):
+    """
+    Add an update function to a digest: by name for a numpy ufunc, and otherwise by its code, constants, defaults and closure,
+    so that lambdas and closures sharing a name (such as lambda z: numpy.tanh(z) and lambda z: numpy.sin(z)) get different keys.
+    The values of global variables the function reads are not part of the key.
+    """
+    digest.update(f"{getattr(f, '__module__', '')}.{getattr(f, '__qualname__', getattr(f, '__name__', repr(f)))}".encode())
+    if isinstance(f, numpy.ufunc):
+        return
+    code = getattr(f, "__code__", None)
+    if code is None:
+        digest.update(repr(f).encode())
+        return
+    _code_digest(digest, code)
+    values = list(getattr(f, "__defaults__", None) or ()) + [cell.cell_contents for cell in getattr(f, "__closure__", None) or ()]
+    for value in values:
+        if isinstance(value, numpy.ndarray):
+            digest.update(numpy.ascontiguousarray(value).data)
+        elif isinstance(value, types.FunctionType):
+            _function_digest(digest, value)
+        else:
+            digest.update(repr(value).encode())
+    return
+
+
+def _code_digest(digest, code):
+    """Add the bytecode, names and constants of a code object (and of the code objects nested in it, such as comprehensions) to a digest."""
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _code_digest(digest, const)
+        else:
+            digest.update(repr(const).encode())
+    return
+
+
+def _size(entry):
+    """Get the number of bytes held by the arrays of an entry."""
+    return sum(array.nbytes for array in entry.values() if array is not None)
@@ -0,0 +1,122 @@
+"""Weight matrices of reservoirs laid out on a grid, stored as weighted shifts of the state rather than as N x N matrices."""
+import numpy
+
+MOORE = [(row, col) for row in (-1, 0, 1) for col in (-1, 0, 1)] #offsets of the Moore neighbourhood of a 2-D grid, including the node itself
+RING = [(-1,), (0,), (1,)] #offsets of the neighbourhood of a ring, including the node itself
+
+
+class Stencil():
+    """
+    Weight matrix of a reservoir whose nodes sit on a grid, such as a ring, lattice or torus.
+
+    (W @ x)[i] = sum over the offsets o of weights[o][i] * x[i + o], where i + o is the node offset by o on the grid, wrapping around its edges.
+    Neighbours falling outside a bounded grid (such as a lattice) get a weight of 0.
+    Only one weight vector per offset is stored, so the weights and W @ x take O(N) memory and time, which lets reservoirs of millions of nodes fit in memory.
+
+    A Stencil supports what TinyESN does with W: W @ x for (N,) and (N, B) arrays, W.T, abs(W), multiplication by a scalar, astype and toarray.
+    It also has the matvec and rmatvec methods scipy.sparse.linalg expects of a linear operator, so that ARPACK can find its eigenvalues.
+    """
+    ndim = 2
+
+    def __init__(self, grid_shape, offsets, weights):
+        """
+        Initialise the stencil.
+
+        grid_shape: shape of the grid, such as (N,) for a ring or (rows, columns) for a lattice or torus.
+        offsets: list of the offsets of the neighbours on the grid, each a tuple with one value per dimension.
+        weights: (len(offsets), N) array of the weight of each neighbour of each node.
+        """
+        self.grid_shape = tuple(int(side) for side in grid_shape)
+        self.offsets = [tuple(int(shift) for shift in offset) for offset in offsets]
+        self.weights = numpy.asarray(weights).reshape((len(self.offsets), -1))
+        size = int(numpy.prod(self.grid_shape))
+        if self.weights.shape[1] != size:
+            raise ValueError("please give one weight per node for every offset")
+        self.shape = (size, size)
+        self.dtype = self.weights.dtype
+        return
+
+    @classmethod
+    def neighbourhood(cls, grid_shape, offsets, periodic):
+        """
+        Create a stencil connecting every node to its neighbours at offsets with a weight of 1.
+
+        periodic: whether the edges of the grid wrap around (ring, torus) or not (lattice), in which case the neighbours falling outside get a weight of 0.
+        Offsets reaching the same neighbour (on grids with fewer than 3 nodes per side) only count once.
+        """
+        grid_shape = tuple(grid_shape)
+        kept = []
+        seen = set()
+        for offset in offsets:
+            wrapped = tuple(shift % side for shift, side in zip(offset, grid_shape)) if periodic else tuple(offset)
+            if wrapped not in seen:
+                seen.add(wrapped)
+                kept.append(offset)
+        weights = numpy.ones((len(kept),) + grid_shape)
+        if not periodic:
+            for weight, offset in zip(weights, kept):
+                for axis, shift in enumerate(offset):
+                    outside = [slice(None)]*len(grid_shape)
+                    outside[axis] = slice(grid_shape[axis] - shift, None) if shift > 0 else slice(None, -shift)
+                    if shift != 0:
+                        weight[tuple(outside)] = 0
+        return cls(grid_shape, kept, weights.reshape((len(kept), -1)))
+
+    def _shift(self, x, offset):
+        """Get the array whose row i is row i + offset of x (on the grid, wrapping around its edges)."""
+        grid = x.reshape(self.grid_shape + x.shape[1:])
+        return numpy.roll(grid, tuple(-shift for shift in offset), axis=tuple(range(len(offset)))).reshape(x.shape)
+
+    def matvec(self, x):
+        """Get W @ x, for x of shape (N,) or (N, B)."""
+        x = numpy.asarray(x)
+        weights = self.weights if x.ndim == 1 else self.weights.reshape(self.weights.shape + (1,)*(x.ndim - 1))
+        y = numpy.zeros(x.shape, dtype=numpy.result_type(self.dtype, x.dtype))
+        for weight, offset in zip(weights, self.offsets):
+            y += weight*self._shift(x, offset)
+        return y
+
+    def rmatvec(self, x):
+        """Get W.T @ x, for x of shape (N,) or (N, B)."""
+        return self.T.matvec(x)
+
+    matmat = matvec
+
+    def __matmul__(self, x):
+        return self.matvec(x)
+
+    @property
+    def T(self):
+        """Get the transpose of W, which is also a stencil: W[i, i + o] = weights[o][i] is W.T[j, j - o] with j = i + o."""
+        weights = numpy.stack([self._shift(weight, tuple(-shift for shift in offset)) for weight, offset in zip(self.weights, self.offsets)])
+        return Stencil(self.grid_shape, [tuple(-shift for shift in offset) for offset in self.offsets], weights)
+
+    def __abs__(self):
+        return Stencil(self.grid_shape, self.offsets, abs(self.weights))
+
+    def __mul__(self, scalar):
+        return Stencil(self.grid_shape, self.offsets, self.weights*scalar)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return self*-1
+
+    def astype(self, dtype, copy=True):
+        """Get the stencil with its weights cast to dtype."""
+        weights = self.weights.astype(dtype, copy=copy)
+        return self if weights is self.weights else Stencil(self.grid_shape, self.offsets, weights)
+
+    @property
+    def nbytes(self):
+        """Number of bytes taken by the weights."""
+        return self.weights.nbytes
+
+    def toarray(self):
+        """Get W as a dense (N, N) array. Only meant for small reservoirs (such as to draw them)."""
+        size = self.shape[0]
+        nodes = numpy.arange(size)
+        dense = numpy.zeros(self.shape, dtype=self.dtype)
+        for weight, offset in zip(self.weights, self.offsets):
+            numpy.add.at(dense, (nodes, self._shift(nodes, offset)), weight)
+        return dense
@@ -0,0 +1,138 @@
+"""
+Run an ESN over a very long input sequence in parallel, by splitting it into overlapping chunks.
+
+By the echo state property [1], a reservoir forgets the state it started from after a number of timesteps. Every chunk is therefore run from a zero state
+over a warmup of the inputs that precede it, the warmup states are dropped, and the remaining states are stitched back together.
+The stitched states are only as close to the ones of a sequential run as the warmup is long enough for the reservoir to forget: boundary_errors and
+sequential_error measure how far they are.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import os
+import numpy
+
+_esn = None #ESN of the worker process, sent once by _init_worker
+
+
+def _init_worker(esn):
+    """Keep the ESN sent to a worker process, so that it is not sent again with every chunk."""
+    global _esn
+    _esn = esn
+    return
+
+
+def _run_window(inputs, previous, skip, state):
+    """
+    Run the ESN of the worker over a window of normalised inputs and drop its first skip states. Runs in the worker processes.
+
+    previous: normalised input preceding the window, used by the discretised update for its first timestep.
+    state: (x, u, v) the window starts from, or None to start from a zero state.
+
+    returns the kept states and the (x, u, v) state at the end of the window.
+    """
+    esn = _esn
+    if state is None:
+        esn.x = numpy.zeros_like(esn.x)
+        esn.u = numpy.reshape(previous, esn.u.shape)
+        esn.v = numpy.zeros_like(esn.v)
+    else:
+        esn.x, esn.u, esn.v = state
+    states = esn._run(inputs, False)
+    return states[skip:], (esn.x, esn.u, esn.v)
+
+
+def _worker_copy(esn):
+    """Copy the ESN without what does not need to be sent to the workers (its state cache, instrumentation and serving buffers)."""
+    worker = copy.copy(esn)
+    worker.state_cache = None
+    worker.instrumentation = None
+    worker._serving = None
+    return worker
+
+
+def _windows(inputs, starts, warmup, state):
+    """Get the arguments of _run_window for chunks starting at starts, each preceded by up to warmup timesteps of warmup."""
+    ends = list(starts[1:]) + [len(inputs)]
+    for start, end in zip(starts, ends):
+        first = max(start - warmup, 0)
+        # a window reaching back to the start of the sequence starts from the actual state of the ESN, so it is exact
+        yield inputs[first:end], None if first == 0 else inputs[first - 1], start - first, state if first == 0 else None
+
+
+def _map_windows(esn, windows, processes):
+    """Run _run_window over windows, in processes worker processes (or in this process if processes is 1)."""
+    windows = list(windows)
+    if processes == 1 or len(windows) == 1:
+        _init_worker(_worker_copy(esn))
+        return [_run_window(*window) for window in windows]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(_worker_copy(esn),)) as executor:
+        return list(executor.map(_run_window, *zip(*windows)))
+
+
+def run(esn, inputs, chunk_size=100000, warmup=1000, processes=None):
+    """
+    Run the reservoir of an ESN over a long input sequence, in chunks simulated in parallel.
+
+    esn: TinyESN to run. Its state is advanced to the end of the sequence, as run would.
+    inputs: array of shape (T, K), or anything that can be reshaped to it.
+    chunk_size (default 100000): number of timesteps of every chunk.
+    warmup (default 1000): number of timesteps every chunk is run over before its first kept state. It should be well over the memory of the reservoir.
+    processes (default None): number of worker processes. None uses every core.
+
+    returns the (T, N) states of the reservoir after each timestep. Each worker process gets the ESN once, and only its chunks of inputs afterwards.
+    """
+    processes = processes or os.cpu_count() or 1
+    inputs = esn._prepare_inputs(inputs)
+    starts = list(range(0, len(inputs), chunk_size)) or [0]
+    state = (esn.x, esn.u, esn.v)
+    results = _map_windows(esn, _windows(inputs, starts, warmup, state), processes)
+    states = numpy.concatenate([result[0] for result in results])
+    esn.x, esn.u, esn.v = (numpy.array(value) for value in results[-1][1])
+    esn.t += len(inputs)
+    return states
+
+
+def boundary_errors(esn, inputs, states, chunk_size=100000, warmup=1000, processes=None):
+    """
+    Estimate how far the stitched states of run are from sequential ones, by running every chunk again with twice the warmup.
+
+    esn: TinyESN in the state run started from. It is not modified.
+    inputs, chunk_size, warmup: the ones given to run.
+    states: the states returned by run.
+    processes (default None): number of worker processes. None uses every core.
+
+    returns the largest absolute difference over the first warmup states of every chunk, between states and the longer warmup run.
+    Chunks whose warmup already reached back to the start of the sequence are exact, and get 0.
+    """
+    processes = processes or os.cpu_count() or 1
+    inputs = esn._prepare_inputs(inputs)
+    starts = list(range(0, len(inputs), chunk_size))
+    ends = starts[1:] + [len(inputs)]
+    windows = [(start, min(end, start + warmup)) for start, end in zip(starts, ends) if start > warmup]
+    state = (esn.x, esn.u, esn.v)
+    results = _map_windows(esn, (window for start, end in windows for window in _windows(inputs[:end], [start], 2*warmup, state)), processes)
+    errors = numpy.zeros(len(starts))
+    for (start, end), (probe, _) in zip(windows, results):
+        errors[starts.index(start)] = numpy.max(abs(probe - states[start:end]))
+    return errors
+
+
+def sequential_error(esn, inputs, states):
+    """
+    Measure exactly how far the stitched states of run are from a sequential run, by doing the sequential run.
+
+    esn: TinyESN in the state run started from (such as a copy.deepcopy of it made before calling run). Its state is advanced to the end of the sequence.
+    inputs: the inputs given to run.
+    states: the states returned by run.
+
+    returns the largest absolute difference between the states of every timestep, as a (T,) array.
+    """
+    reference = esn.run(inputs)
+    return numpy.max(abs(reference - states), axis=1)
+
+
+"""
+Bibliography:
+
+[1] Yildiz, Izzet B., Herbert Jaeger, and Stefan J. Kiebel. 2012. “Re-Visiting the Echo State Property.” Neural Networks: The Official Journal of the International Neural Network Society 35 (November): 1–9.
+"""
@@ -1,5 +1,6 @@
 from numpy.core.fromnumeric import size
 from benchmark import *
+from dataset import Dataset
 import numpy
 
 class Xor_benchmark(BenchMark):
@@ -7,21 +8,17 @@ class Xor_benchmark(BenchMark):
         return
 
     def create_training_set(self, set_size):
-        training_set = {}
         size_root = int(numpy.sqrt(set_size))
         set_size = size_root**2 # resize the thing to be a square number 
-        a = numpy.random.randint(size_root, size=set_size)
-        a = numpy.random.permutation(a)
-        b = numpy.random.randint(size_root, size=set_size)
-        b = numpy.random.permutation(b)
+        a = self.rng.integers(size_root, size=set_size)
+        a = self.rng.permutation(a)
+        b = self.rng.integers(size_root, size=set_size)
+        b = self.rng.permutation(b)
 
-        for i in range(size_root):
-            for j in range(size_root):
-                training_set[(a[i]/(size_root*2), b[j]/(size_root*2))] = numpy.array([(a[i] ^ b[j])/(size_root*2)])
-        # ok, this doesn't work, because obviously you cannot repeat keys
-        # except we have few enough values that it doesn't actually become anything
-        # I think i have "good code"ed myself into a corner
-        return training_set
+        i, j = numpy.divmod(numpy.arange(set_size), size_root)
+        inputs = numpy.stack((a[i]/(size_root*2), b[j]/(size_root*2)), axis=1)
+        targets = (a[i] ^ b[j])/(size_root*2)
+        return Dataset(inputs, targets)
 
     def reset(self):
         # uhhhhhhhhhhhhhh